@@ -24,7 +24,7 @@ app = typer.Typer(
 config_app = typer.Typer(name="config", help="Manage the config", no_args_is_help=True)
 add_app = typer.Typer(name="add", help="Add a new resource", no_args_is_help=True)
 list_app = typer.Typer(name="list", help="List resources", no_args_is_help=True)
-# sync_app = typer.Typer(name="sync", help="Sync resources", no_args_is_help=True)
+sync_app = typer.Typer(name="sync", help="Sync resources", no_args_is_help=True)
 delete_app = typer.Typer(name="delete", help="Delete resources", no_args_is_help=True)
 remove_app = typer.Typer(name="remove", help="Remove resources", no_args_is_help=True)
 
@@ -32,7 +32,7 @@ remove_app = typer.Typer(name="remove", help="Remove resources", no_args_is_help
 app.add_typer(config_app, rich_help_panel="Utils and Configs")
 app.add_typer(add_app, rich_help_panel="Manage Resources")
 app.add_typer(list_app, rich_help_panel="Manage Resources")
-# app.add_typer(sync_app, rich_help_panel="Manage Resources")
+app.add_typer(sync_app, rich_help_panel="Manage Resources")
 app.add_typer(delete_app, rich_help_panel="Manage Resources")
 app.add_typer(remove_app, rich_help_panel="Manage Resources", hidden=True)
 
@@ -127,6 +127,22 @@ def chat_command(
     chat(files=filepaths, urls=urls, sources=sources)
 
 
+@app.command(name="watch")
+def watch_command(
+    path: str = typer.Argument(default=".", help="Directory to keep indexed"),
+    workers: int = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        help="Number of processes used to create embeddings (default: embedding_workers in the config)",
+    ),
+):
+    """Keep the local source for a directory up to date as files change"""
+    from .commands import watch
+
+    watch(path, workers=workers)
+
+
 @config_app.command(name="show")
 def show_config_command():
     """Show the current config"""
@@ -172,7 +188,15 @@ def list_sources_command():
 
 
 @add_app.command(name="source")
-def add_source_command(link: str = typer.Argument(default="", help="Link to the source")):
+def add_source_command(
+    link: str = typer.Argument(default="", help="Link to the source"),
+    workers: int = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        help="Number of processes used to create embeddings in local mode (default: embedding_workers in the config)",
+    ),
+):
     """Add a new source"""
     from .commands import add_source
 
@@ -192,7 +216,7 @@ def add_source_command(link: str = typer.Argument(default="", help="Link to the
     if name in ["docs", "www", "en", "platform", "blog"]:
         name = parsed_url.netloc.split(".")[1]
     name = input(f"Name for the source [default: {name}]: ") or name
-    add_source(name, link)
+    add_source(name, link, workers=workers)
 
 
 @add_app.command(name="sources", hidden=True)
@@ -218,6 +242,22 @@ def delete_source_command(names: List[str] = typer.Argument(help=generate_delete
 
 
 # Sync Commands
+@sync_app.command(name="source", no_args_is_help=True)
+def sync_source_command(
+    name: str = typer.Argument(help="Name of the local source to sync"),
+    workers: int = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        help="Number of processes used to create embeddings (default: embedding_workers in the config)",
+    ),
+):
+    """Re-index only the files of a local source that changed"""
+    from .commands import sync_source
+
+    sync_source(name, workers=workers)
+
+
 # @sync_app.command(name="plugin")
 # def sync_plugin_command(name: str):
 #     """Sync a plugin"""
@@ -11,6 +11,8 @@ from .list_plugins import list_plugins
 from .list_sources import list_sources
 from .login import login
 from .sync_plugin import sync_plugin
+from .sync_source import sync_source
+from .watch import watch
 
 __all__ = [
     "login",
@@ -23,4 +25,6 @@ __all__ = [
     "add_source",
     "delete_source",
     "sync_plugin",
+    "sync_source",
+    "watch",
 ]
@@ -1,7 +1,7 @@
 import os
 
 from .config import load_config
-from .utils.vectordb import create_local_qdrant_db, create_remote_qdrant_db
+from .utils.vectordb import create_remote_qdrant_db, sync_local_qdrant_db
 
 
 def fix_name(name):
@@ -15,7 +15,7 @@ def fix_name(name):
     return name
 
 
-def add_web_source(link, name=None, remote=False):
+def add_web_source(link, name=None, remote=False, workers=None):
     config = load_config()
     remote = False if config["local_mode"] else True
     print(f"Indexing {link}...")
@@ -28,11 +28,12 @@ def add_web_source(link, name=None, remote=False):
     if remote:
         create_remote_qdrant_db(collection_name=name, link=link)
     else:
-        create_local_qdrant_db(collection_name=name, link=link, remote=remote)
+        # Only re-indexes pages that changed if the source was indexed before
+        sync_local_qdrant_db(collection_name=name, link=link, workers=workers, revalidate=False)
     return name
 
 
-def add_local_source(path=None, name=None):
+def add_local_source(path=None, name=None, workers=None):
     config = load_config()
     if path == "local":
         path = "."
@@ -45,15 +46,16 @@ def add_local_source(path=None, name=None):
     if remote:
         create_remote_qdrant_db(collection_name=collection_name, path=path)
     else:
-        create_local_qdrant_db(collection_name=collection_name, path=path, remote=remote)
+        # Only re-indexes files that changed if the source was indexed before
+        sync_local_qdrant_db(collection_name=collection_name, path=path, workers=workers)
 
     return collection_name
 
 
-def add_source(name, link):
+def add_source(name, link, workers=None):
     name = fix_name(name)
 
     if link:
-        add_web_source(link, name)
+        add_web_source(link, name, workers=workers)
     else:
-        add_local_source()
+        add_local_source(workers=workers)
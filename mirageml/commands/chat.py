@@ -14,7 +14,7 @@ from .utils.codeblocks import (
     extract_code_from_markdown,
 )
 from .utils.custom_inputs import multiline_input
-from .utils.llm import llm_call
+from .utils.llm import llm_call, prewarm_local_llm
 
 console = Console()
 config = load_config()
@@ -22,6 +22,9 @@ config = load_config()
 
 def chat(files: list[str] = [], urls: list[str] = [], sources: list[str] = []):
     # Beginning of the chat sequence
+    if config["local_mode"]:
+        prewarm_local_llm()
+
     transient_sources = []
     if files or urls or sources:
         index_local = False
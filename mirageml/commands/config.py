@@ -28,15 +28,17 @@ def save_config(config):
 def set_config():
     config = load_config()
 
+    # Options, parser and the value used while the key isn't in the config. The tuning keys in the README are
+    # set by editing ~/.mirageml.json.
     valid = {
-        "local_mode": (("True (not recommended without GPU)", "False"), json.loads),
-        "model": (("gpt-3.5-turbo", "gpt-4"), str),
+        "local_mode": (("True (not recommended without GPU)", "False"), json.loads, False),
+        "model": (("gpt-3.5-turbo", "gpt-4"), str, "gpt-4"),
+        "web_extractor": (("remote", "local"), str, "remote"),
+        "request_compression": (("True", "False"), json.loads, False),
     }
 
-    for key, value in config.items():
-        if key not in valid:
-            continue
-        curvalue = value
+    for key in valid:
+        curvalue = config.get(key, valid[key][2])
         while True:
             question = f"Enter the value for '{key}' [{', '.join(valid[key][0])}] (current value: {curvalue}): "
             value = input(question)
@@ -1,8 +1,9 @@
 import keyring
-import requests
 import typer
 
-from mirageml.constants import SERVICE_ID, SUPABASE_KEY, SUPABASE_URL
+from mirageml.constants import SERVICE_ID, SUPABASE_KEY, SUPABASE_URL, get_access_token
+
+from .utils import http_client
 
 plugin_mapping = {
     "google_token": "gdrive",
@@ -11,7 +12,7 @@ plugin_mapping = {
 
 
 def list_plugins():
-    access_token = keyring.get_password(SERVICE_ID, "access_token")
+    access_token = get_access_token()
     user_id = keyring.get_password(SERVICE_ID, "user_id")
     params = {"input_user_id": user_id}
     headers = {
@@ -19,7 +20,7 @@ def list_plugins():
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json",
     }
-    response = requests.post(f"{SUPABASE_URL}/rest/v1/rpc/user_plugins", json=params, headers=headers)
+    response = http_client.post(f"{SUPABASE_URL}/rest/v1/rpc/user_plugins", json=params, headers=headers)
     response_data = response.json()[0]
     connected_plugin_string = "Connected plugins: "
     for key in response_data:
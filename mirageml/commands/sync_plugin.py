@@ -1,8 +1,9 @@
 import keyring
-import requests
 import typer
 
-from mirageml.constants import NOTION_SYNC_ENDPOINT, SERVICE_ID
+from mirageml.constants import NOTION_SYNC_ENDPOINT, SERVICE_ID, get_access_token
+
+from .utils import http_client
 
 
 def sync_plugin(args):
@@ -17,11 +18,11 @@ def sync_plugin(args):
             )
             return
         else:
-            access_token = keyring.get_password(SERVICE_ID, "access_token")
+            access_token = get_access_token()
             headers = {
                 "Authorization": f"Bearer {access_token}",
             }
-            sync_response = requests.post(NOTION_SYNC_ENDPOINT, json={}, headers=headers)
+            sync_response = http_client.post(NOTION_SYNC_ENDPOINT, json={}, headers=headers)
             sync_response_data = sync_response.json()
             if "error" in sync_response_data:
                 typer.secho(sync_response_data["error"], fg=typer.colors.BRIGHT_RED, bold=True)
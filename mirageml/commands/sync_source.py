@@ -0,0 +1,17 @@
+import typer
+
+from .utils.manifest import load_manifest
+from .utils.vectordb import sync_local_qdrant_db
+
+
+def sync_source(name, workers=None):
+    if load_manifest(name) is None:
+        typer.secho(
+            f"Source: {name} has no manifest to sync from. Re-add it with `mirageml add source`",
+            fg=typer.colors.BRIGHT_RED,
+            bold=True,
+        )
+        return
+
+    print(f"Syncing {name}...")
+    sync_local_qdrant_db(collection_name=name, workers=workers)
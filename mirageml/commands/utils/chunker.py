@@ -0,0 +1,265 @@
+import os
+import re
+from collections import deque
+from urllib.parse import urlparse
+
+PYTHON_EXTENSIONS = {".py", ".pyi"}
+CODE_EXTENSIONS = {
+    ".c",
+    ".cc",
+    ".cpp",
+    ".cs",
+    ".cjs",
+    ".go",
+    ".h",
+    ".hpp",
+    ".java",
+    ".js",
+    ".jsx",
+    ".kt",
+    ".mjs",
+    ".php",
+    ".rb",
+    ".rs",
+    ".scala",
+    ".swift",
+    ".ts",
+    ".tsx",
+}
+MARKDOWN_EXTENSIONS = {".md", ".mdx", ".markdown"}
+
+# Declarations that start a new top-level unit in the common C-like and scripting languages
+CODE_BOUNDARY = re.compile(
+    r"(?:export\s+(?:default\s+)?)?(?:pub(?:\([^)]*\))?\s+)?"
+    r"(?:(?:public|private|protected|internal|static|abstract|final|async|unsafe|extern|inline|override|open|data|"
+    r"sealed|partial|virtual)\s+)*"
+    r"(?:function\*?|class|interface|struct|enum|trait|impl|fn|func|def|module|namespace|object|union|"
+    r"(?:const|let|var)\s+\w+\s*=\s*(?:async\s+)?(?:function|\([^)]*\)\s*=>|\w+\s*=>))\b"
+)
+# Python functions and classes, found by scanning lines since parsing the file costs far more than the split is worth
+PYTHON_BOUNDARY = re.compile(r"(?:async\s+)?(?:def|class)\s")
+COMMENT_PREFIXES = ("//", "/*", "*", "#", "@")
+MARKDOWN_HEADING = re.compile(r"#{1,6}\s")
+PROSE_SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+
+class Chunker:
+    """
+    Splits documents into chunks of at most chunk_size, measured with length_function.
+
+    Python and other common languages are split on their outermost declarations, found by scanning
+    lines, and markdown on headings. Units that are still too large are split one nesting
+    level down, then on paragraphs, lines and words. Consecutive chunks share up to chunk_overlap
+    of trailing text. A Chunker holds no per-document state and can be reused.
+
+    When measuring is expensive, e.g. with a tokenizer, batch_length_function can measure a list of
+    texts in one call, and max_chars bounds the characters a chunk can have so that longer texts are
+    split without being measured.
+    """
+
+    def __init__(
+        self, chunk_size=2048, chunk_overlap=80, length_function=len, batch_length_function=None, max_chars=None
+    ):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_function = length_function
+        self.batch_length_function = batch_length_function
+        self.max_chars = max_chars
+
+    def split_text(self, text, source=""):
+        return [chunk for chunk, _ in self.split_text_with_lengths(text, source)]
+
+    def split_text_with_lengths(self, text, source=""):
+        """Split text like split_text, returning (chunk, length) pairs."""
+        # Documents are prefixed with their source, keep it on the first chunk without parsing it as code
+        prefix = ""
+        if source and text.startswith(source + ": "):
+            prefix, text = text[: len(source) + 2], text[len(source) + 2 :]
+
+        extension = os.path.splitext(urlparse(source).path if "://" in source else source)[1].lower()
+        if extension in PYTHON_EXTENSIONS or extension in CODE_EXTENSIONS:
+            lines = text.splitlines(keepends=True)
+            boundary = PYTHON_BOUNDARY if extension in PYTHON_EXTENSIONS else CODE_BOUNDARY
+            pieces = self._code_pieces(lines, 0, len(lines), boundary)
+        elif extension in MARKDOWN_EXTENSIONS:
+            pieces = self._markdown_pieces(text)
+        else:
+            pieces = self._fit(text)
+
+        if prefix:
+            pieces = self._fit(prefix + pieces[0][0]) + pieces[1:] if pieces else self._fit(prefix)
+        return self._merge(pieces)
+
+    def _lengths(self, texts):
+        """Measure texts, in one call if possible. Texts over max_chars are reported as too long."""
+        lengths = [self.chunk_size + 1] * len(texts)
+        measured = [i for i, text in enumerate(texts) if self.max_chars is None or len(text) <= self.max_chars]
+        if self.batch_length_function and measured:
+            values = self.batch_length_function([texts[i] for i in measured])
+        else:
+            values = [self.length_function(texts[i]) for i in measured]
+        for i, length in zip(measured, values):
+            lengths[i] = length
+        return lengths
+
+    def _fit(self, text, separators=PROSE_SEPARATORS, length=None):
+        """Split text on the first separator it contains until every piece fits, returning (piece, length) pairs."""
+        if length is None:
+            length = self._lengths([text])[0]
+        if length <= self.chunk_size:
+            return [(text, length)] if text else []
+        for i, separator in enumerate(separators):
+            if separator in text:
+                parts = text.split(separator)
+                parts = [part + separator for part in parts[:-1]] + parts[-1:]
+                groups = self._group(parts)
+                texts = ["".join(group) for group in groups]
+                pieces = []
+                for group, group_text, group_length in zip(groups, texts, self._lengths(texts)):
+                    if group_length <= self.chunk_size or len(group) == 1:
+                        pieces.extend(self._fit(group_text, separators[i + 1 :], group_length))
+                    else:
+                        for part, part_length in zip(group, self._lengths(group)):
+                            pieces.extend(self._fit(part, separators[i + 1 :], part_length))
+                return pieces
+        # No separator left, e.g. minified code, so cut it in half until it fits
+        middle = len(text) // 2
+        halves = [text[:middle], text[middle:]]
+        return [
+            piece
+            for half, half_length in zip(halves, self._lengths(halves))
+            for piece in self._fit(half, [], half_length)
+        ]
+
+    def _group(self, parts):
+        """
+        Join runs of short parts before measuring them, so a long text without paragraphs isn't measured
+        one sentence or word at a time. Only done when max_chars is set, i.e. measuring is expensive.
+        """
+        if self.max_chars is None:
+            return [[part] for part in parts]
+        groups, size = [], 0
+        for part in parts:
+            if groups and size + len(part) <= self.chunk_size // 2:
+                groups[-1].append(part)
+                size += len(part)
+            else:
+                groups.append([part])
+                size = len(part)
+        return groups
+
+    def _merge(self, pieces):
+        """Pack consecutive (piece, length) pairs into (chunk, length) pairs, carrying trailing pieces over as overlap."""
+        chunks, current, lengths, total = [], deque(), deque(), 0
+        for piece, length in pieces:
+            if current and total + length > self.chunk_size:
+                chunks.append(("".join(current), total))
+                while current and (total > self.chunk_overlap or total + length > self.chunk_size):
+                    current.popleft()
+                    total -= lengths.popleft()
+            current.append(piece)
+            lengths.append(length)
+            total += length
+        if current:
+            chunks.append(("".join(current), total))
+        return [(chunk.strip(), length) for chunk, length in chunks if chunk.strip()]
+
+    def _segments(self, lines, start, end, boundaries):
+        """Split lines[start:end] at the sorted boundary line numbers, returning (first line, last line, text)."""
+        boundaries = [boundary for boundary in boundaries if start < boundary < end]
+        return [
+            (seg_start, seg_end, "".join(lines[seg_start:seg_end]))
+            for seg_start, seg_end in zip([start] + boundaries, boundaries + [end])
+        ]
+
+    def _attach_comments(self, lines, boundary, floor):
+        """Move a boundary up over the comments and decorators directly above it."""
+        while boundary - 1 > floor and lines[boundary - 1].lstrip().startswith(COMMENT_PREFIXES):
+            boundary -= 1
+        return boundary
+
+    def _code_pieces(self, lines, start, end, boundary=CODE_BOUNDARY):
+        matches = [i for i in range(start + 1, end) if boundary.match(lines[i].lstrip())]
+        if not matches:
+            return self._fit("".join(lines[start:end]))
+
+        # Only split on the outermost declarations in the range
+        indent = min(len(lines[i]) - len(lines[i].lstrip()) for i in matches)
+        boundaries = [
+            self._attach_comments(lines, i, start) for i in matches if len(lines[i]) - len(lines[i].lstrip()) == indent
+        ]
+
+        pieces = []
+        segments = self._segments(lines, start, end, boundaries)
+        for (seg_start, seg_end, segment), length in zip(
+            segments, self._lengths([segment for _, _, segment in segments])
+        ):
+            if length > self.chunk_size:
+                pieces.extend(self._code_pieces(lines, seg_start, seg_end, boundary))
+            elif segment:
+                pieces.append((segment, length))
+        return pieces
+
+    def _markdown_pieces(self, text):
+        lines = text.splitlines(keepends=True)
+        boundaries, in_fence = [], False
+        for i, line in enumerate(lines):
+            if line.lstrip().startswith("```"):
+                in_fence = not in_fence
+            elif not in_fence and MARKDOWN_HEADING.match(line):
+                boundaries.append(i)
+
+        pieces = []
+        segments = self._segments(lines, 0, len(lines), boundaries)
+        for (_, _, segment), length in zip(segments, self._lengths([segment for _, _, segment in segments])):
+            pieces.extend(self._fit(segment, length=length))
+        return pieces
+
+
+def describe_chunk_lengths(lengths, chunk_size, unit="tokens"):
+    """Summarize the distribution of chunk lengths in one line."""
+    if not lengths:
+        return "Chunk sizes: no chunks"
+    lengths = sorted(lengths)
+
+    def percentile(p):
+        return lengths[min(int(len(lengths) * p), len(lengths) - 1)]
+
+    full = sum(1 for length in lengths if length >= chunk_size * 0.9)
+    return (
+        f"Chunk sizes: {len(lengths)} chunks, p10 {percentile(0.1)} / p50 {percentile(0.5)} / p90 {percentile(0.9)}"
+        f" / max {lengths[-1]} {unit} of {chunk_size}, {full / len(lengths):.0%} over 90% full"
+    )
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from .local_source import iter_documents
+
+    documents = list(iter_documents(sys.argv[1] if len(sys.argv) > 1 else "."))
+    total_bytes = sum(len(data) for data, _ in documents)
+    print(f"Chunking {len(documents)} documents ({total_bytes / 1024**2:.1f} MB)")
+
+    start_time = time.time()
+    chunker = Chunker()
+    chunks = [chunk for data, metadata in documents for chunk in chunker.split_text(data, metadata["source"])]
+    elapsed = time.time() - start_time
+    print(f"Chunker: {len(chunks)} chunks in {elapsed:.2f}s ({total_bytes / 1024**2 / elapsed:.1f} MB/sec)")
+
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        print("Install langchain to compare against RecursiveCharacterTextSplitter")
+    else:
+        start_time = time.time()
+        chunks = []
+        for data, _ in documents:
+            text_splitter = RecursiveCharacterTextSplitter(chunk_size=2048, chunk_overlap=80)
+            chunks.extend(x.page_content for x in text_splitter.create_documents([data]))
+        elapsed = time.time() - start_time
+        print(
+            f"RecursiveCharacterTextSplitter: {len(chunks)} chunks in {elapsed:.2f}s "
+            f"({total_bytes / 1024**2 / elapsed:.1f} MB/sec)"
+        )
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(__file__)
+EMBEDDING_CACHE_DIR = os.path.join(PACKAGE_DIR, "embedding_cache")
+EMBEDDING_CACHE_MAX_BYTES = 1024**3
+
+KEY_SIZE = 16
+# Fraction of the size cap that is kept when the cache is compacted, so eviction doesn't run on every write
+EVICTION_TARGET = 0.75
+
+
+def hash_text(text):
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=KEY_SIZE).digest()
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path, shared with other processes, while the block runs."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache for a single embedding model, shared by every process using it.
+
+    Vectors are stored as a flat float32 file that is memory-mapped for reads, next to a file of
+    fixed-size text hashes where row i of one matches row i of the other. `meta.json` holds the
+    number of committed rows and the generation directory they are in, so a partially written append
+    or compaction is ignored. Appends and compactions take a file lock and start from what meta.json
+    says, not from what this process last saw.
+    """
+
+    def __init__(self, embedding_model_id, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self.embedding_model_id = embedding_model_id
+        self.max_bytes = max_bytes
+        self.cache_dir = os.path.join(EMBEDDING_CACHE_DIR, embedding_model_id.replace("/", "--"))
+        self.meta_path = os.path.join(self.cache_dir, "meta.json")
+        self.lock_path = os.path.join(self.cache_dir, "lock")
+
+        self.hits, self.misses = 0, 0
+        self.dim, self.count, self.generation = None, 0, None
+        self._index, self._vectors = {}, None
+        self._meta_signature = None
+        self._lock = threading.Lock()
+        # Keys read during this process, kept first when the cache is compacted
+        self._used = set()
+        self._refresh()
+
+    def _data_path(self, name, generation):
+        # Compacted rows go to a new gen-N directory, the rows written before the first compaction are in cache_dir
+        if generation is None:
+            return os.path.join(self.cache_dir, name)
+        return os.path.join(self.cache_dir, f"gen-{generation}", name)
+
+    def _stat_meta(self):
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        """Pick up rows other processes committed since meta.json was last read."""
+        if self._stat_meta() == self._meta_signature:
+            return
+        with file_lock(self.lock_path):
+            self._reload()
+
+    def _reload(self):
+        # Only called holding the file lock, so meta.json and the files it points to don't change underneath
+        self._meta_signature = self._stat_meta()
+        if self._meta_signature is None:
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        generation, count = meta.get("generation"), meta["count"]
+        # Rows are only ever appended within a generation, so the rows already indexed are still valid
+        start = self.count if generation == self.generation and count >= self.count else 0
+        if start == 0:
+            self._index = {}
+        if count > start:
+            with open(self._data_path("keys.bin", generation), "rb") as f:
+                f.seek(start * KEY_SIZE)
+                keys = f.read((count - start) * KEY_SIZE)
+            for i in range(count - start):
+                self._index[keys[i * KEY_SIZE : (i + 1) * KEY_SIZE]] = start + i
+
+        self.dim, self.count, self.generation = meta["dim"], count, generation
+        self._vectors = None
+        if count:
+            vectors_path = self._data_path("vectors.f32", generation)
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+
+    def _write_meta(self, count, generation):
+        # Replacing meta.json is what commits an append or a compaction
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "count": count, "generation": generation, "model": self.embedding_model_id}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def get_many(self, text_list):
+        """Return the cached vector for each text, or None where the text has not been embedded yet."""
+        vectors = []
+        with self._lock:
+            self._refresh()
+            for text in text_list:
+                key = hash_text(text)
+                row = self._index.get(key)
+                if row is None:
+                    self.misses += 1
+                    vectors.append(None)
+                else:
+                    self.hits += 1
+                    self._used.add(key)
+                    vectors.append(self._vectors[row].tolist())
+        return vectors
+
+    def put_many(self, text_list, vectors):
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with file_lock(self.lock_path):
+                self._reload()
+                new_rows = {}
+                for text, vector in zip(text_list, vectors):
+                    key = hash_text(text)
+                    if key not in self._index:
+                        new_rows.setdefault(key, vector)
+                if not new_rows:
+                    return
+
+                new_vectors = np.asarray(list(new_rows.values()), dtype=np.float32)
+                if self.dim is None:
+                    self.dim = new_vectors.shape[1]
+                os.makedirs(os.path.dirname(self._data_path("keys.bin", self.generation)), exist_ok=True)
+
+                # Drop anything past the last committed row before appending
+                for name, data, row_size in (
+                    ("keys.bin", b"".join(new_rows), KEY_SIZE),
+                    ("vectors.f32", new_vectors.tobytes(), self.dim * 4),
+                ):
+                    with open(self._data_path(name, self.generation), "ab") as f:
+                        f.truncate(self.count * row_size)
+                        f.write(data)
+
+                self._write_meta(self.count + len(new_rows), self.generation)
+                self._reload()
+
+                if self.count * (self.dim * 4 + KEY_SIZE) > self.max_bytes:
+                    self._evict()
+
+    def _evict(self):
+        # Keep rows read during this process first, then the most recently written ones
+        keep_count = int(self.max_bytes * EVICTION_TARGET) // (self.dim * 4 + KEY_SIZE)
+        used = {self._index[key] for key in self._used if key in self._index}
+        recent = [row for row in range(self.count - 1, -1, -1) if row not in used]
+        keep = sorted((sorted(used, reverse=True) + recent)[:keep_count])
+
+        with open(self._data_path("keys.bin", self.generation), "rb") as f:
+            keys = f.read(self.count * KEY_SIZE)
+        kept_keys = b"".join(keys[row * KEY_SIZE : (row + 1) * KEY_SIZE] for row in keep)
+        kept_vectors = np.ascontiguousarray(self._vectors[keep])
+
+        # Write the kept rows to a new generation and switch meta.json to it, so an interrupted compaction
+        # leaves the old generation in place
+        old_generation, generation = self.generation, (self.generation or 0) + 1
+        generation_dir = os.path.dirname(self._data_path("keys.bin", generation))
+        shutil.rmtree(generation_dir, ignore_errors=True)
+        os.makedirs(generation_dir)
+        for name, data in (("keys.bin", kept_keys), ("vectors.f32", kept_vectors.tobytes())):
+            with open(self._data_path(name, generation), "wb") as f:
+                f.write(data)
+        self._write_meta(len(keep), generation)
+        self._used = set()
+        self._reload()
+
+        # Other processes may still have the old files mapped, which is fine on POSIX and skipped where it isn't
+        if old_generation is None:
+            for name in ("keys.bin", "vectors.f32"):
+                try:
+                    os.remove(self._data_path(name, None))
+                except OSError:
+                    pass
+        for name in os.listdir(self.cache_dir):
+            if name.startswith("gen-") and name != f"gen-{generation}":
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = 100 * self.hits / total if total else 0.0
+        return f"Embedding cache: {self.hits}/{total} chunks reused ({hit_rate:.1f}% hit rate)"
+
+
+_embedding_caches = {}
+_embedding_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(embedding_model_id):
+    with _embedding_caches_lock:
+        if embedding_model_id not in _embedding_caches:
+            _embedding_caches[embedding_model_id] = EmbeddingCache(embedding_model_id)
+        return _embedding_caches[embedding_model_id]
@@ -0,0 +1,283 @@
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+
+import requests
+
+from . import http_client
+
+# Pages fetched at once, and the connections kept open per host so they can be reused
+FETCH_WORKERS = 16
+FETCH_TIMEOUT = 15
+MAX_PAGE_BYTES = 8 * 1024**2
+# The only answers that mean a page no longer exists, rather than that it couldn't be fetched this time
+GONE_STATUSES = {404, 410}
+# Smaller pages are converted in the fetching thread, sending them to another process costs more than it saves
+PARSE_IN_PROCESS_BYTES = 32 * 1024
+
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "nav", "footer", "aside", "form", "button"}
+CONTENT_TAGS = {"main", "article"}
+BLOCK_TAGS = {
+    "p",
+    "div",
+    "section",
+    "table",
+    "ul",
+    "ol",
+    "dl",
+    "blockquote",
+    "figure",
+    "hr",
+    "header",
+    "details",
+    "summary",
+} | CONTENT_TAGS
+LINE_TAGS = {"li", "tr", "dt", "dd", "br", "caption"}
+HEADINGS = {f"h{level}": level for level in range(1, 7)}
+WHITESPACE = re.compile(r"\s+")
+BLANK_LINES = re.compile(r"\n\s*\n\s*\n+")
+
+
+class HTMLTextParser(HTMLParser):
+    """
+    Converts HTML to markdown-like text: headings become `#` lines, list items `- ` lines, and <pre> blocks
+    are kept verbatim in fences. Scripts, styles and site chrome like <nav> and <footer> are dropped.
+    If the page has a <main> or <article>, only the text inside it is kept.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self._parts, self._content_parts = [], []
+        self._skip, self._content, self._pre = 0, 0, 0
+        self._in_title = False
+
+    def _emit(self, text):
+        self._parts.append(text)
+        if self._content:
+            self._content_parts.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        if self._skip:
+            return
+        if tag == "title":
+            self._in_title = True
+        elif tag in CONTENT_TAGS:
+            self._content += 1
+        if tag in HEADINGS:
+            self._emit("\n\n" + "#" * HEADINGS[tag] + " ")
+        elif tag == "pre":
+            self._pre += 1
+            self._emit("\n\n```\n")
+        elif tag == "code" and not self._pre:
+            self._emit("`")
+        elif tag == "li":
+            self._emit("\n- ")
+        elif tag in ("td", "th"):
+            self._emit(" | ")
+        elif tag in BLOCK_TAGS:
+            self._emit("\n\n")
+        elif tag in LINE_TAGS:
+            self._emit("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/> and <hr/> have no end tag to balance
+        if not self._skip and tag in BLOCK_TAGS | LINE_TAGS:
+            self._emit("\n\n" if tag in BLOCK_TAGS else "\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+            return
+        if self._skip:
+            return
+        if tag == "title":
+            self._in_title = False
+        elif tag == "pre" and self._pre:
+            self._pre -= 1
+            self._emit("\n```\n\n")
+        elif tag == "code" and not self._pre:
+            self._emit("`")
+        elif tag in HEADINGS or tag in BLOCK_TAGS:
+            self._emit("\n\n")
+        if tag in CONTENT_TAGS and self._content:
+            self._content -= 1
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._in_title:
+            self.title += data
+        elif self._pre:
+            self._emit(data)
+        else:
+            self._emit(WHITESPACE.sub(" ", data))
+
+    def text(self):
+        content = "".join(self._content_parts)
+        lines, in_fence = [], False
+        for line in (content if content.strip() else "".join(self._parts)).split("\n"):
+            if line.strip() == "```":
+                in_fence = not in_fence
+            # Indentation only means something inside <pre>
+            lines.append(line.rstrip() if in_fence else line.strip())
+        text = BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+        title = WHITESPACE.sub(" ", self.title).strip()
+        if title and not text.startswith("# "):
+            text = f"# {title}\n\n{text}" if text else f"# {title}"
+        return text
+
+
+def html_to_text(html):
+    """Convert an HTML document to markdown-like text."""
+    parser = HTMLTextParser()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+class LocalExtractor:
+    """
+    Fetches pages on the shared HTTP session and converts them to text in-process, as a drop-in for the
+    extract endpoint. Large pages are converted on a pool of processes so parsing uses every core.
+    """
+
+    def __init__(self, fetch_workers=FETCH_WORKERS, parse_workers=None):
+        self.fetch_workers = fetch_workers
+        self._fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="fetch")
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self._parse_pool = None
+        self._lock = threading.Lock()
+
+    def _parse(self, html):
+        if self.parse_workers <= 1 or len(html) < PARSE_IN_PROCESS_BYTES:
+            return html_to_text(html)
+        with self._lock:
+            if self._parse_pool is None:
+                # The pool is started from a fetch thread, so forking this process could copy a lock another
+                # thread holds. A fork server imports this module once and forks clean workers from it instead.
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload([__name__])
+                else:
+                    context = multiprocessing.get_context("spawn")
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=context)
+        return self._parse_pool.submit(html_to_text, html).result()
+
+    def fetch(self, url):
+        """
+        Return (page, validators) for url, or (None, None) if it is gone (404/410) or isn't text.
+
+        Any other failure raises, so the page can be told apart from one that is gone.
+        """
+        response = http_client.get(url, timeout=FETCH_TIMEOUT)
+        if response.status_code in GONE_STATUSES:
+            return None, None
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "text/html").split(";")[0].strip().lower()
+        if len(response.content) > MAX_PAGE_BYTES or not content_type.startswith(("text/", "application/xhtml")):
+            return None, None
+
+        text = self._parse(response.text) if "html" in content_type else response.text.strip()
+        validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        return {"source": url, "data": text, "metadata": {"source": url}}, validators
+
+    def extract(self, urls, on_error=None):
+        """
+        Yield (page, validators) for each url that could be extracted, in the order they finish.
+
+        A page that fails to fetch is skipped, and on_error(url, error) is called for it if given.
+        """
+        futures = {self._fetch_pool.submit(self.fetch, url): url for url in urls}
+        for future in as_completed(futures):
+            try:
+                page, validators = future.result()
+            except requests.RequestException as e:
+                if on_error:
+                    on_error(futures[future], e)
+                continue
+            if page is not None:
+                yield page, validators
+
+
+_local_extractor = None
+_local_extractor_lock = threading.Lock()
+
+
+def get_local_extractor():
+    global _local_extractor
+    with _local_extractor_lock:
+        if _local_extractor is None:
+            _local_extractor = LocalExtractor()
+        return _local_extractor
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    # e.g. python -m mirageml.commands.utils.html_extract [pages] [extract endpoint that can reach this machine]
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # Pages over PARSE_IN_PROCESS_BYTES, so they are converted on the parse pool
+    paragraphs = "".join(f"<p>Paragraph {i} with <a href='#'>a link</a> and <code>code</code>.</p>" for i in range(800))
+    body = (
+        "<html><head><title>Fixture {page}</title><style>p {{ color: red }}</style></head><body>"
+        "<nav><a href='/'>Home</a><a href='/docs'>Docs</a></nav><main><h1>Page {page}</h1>" + paragraphs + ""
+        "<pre>def f():\n    return {page}</pre><ul><li>one</li><li>two</li></ul></main>"
+        "<footer>Copyright</footer><script>var x = 1;</script></body></html>"
+    )
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            content = body.format(page=self.path).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}/page{i}" for i in range(pages)]
+    print(f"Fixture site: {pages} pages of {len(body) / 1024:.0f} KB")
+
+    # The parse pool against converting every page in the fetching threads, with at least two workers so the pool
+    # is used even on one core
+    for name, extractor in [
+        ("in the fetch threads", LocalExtractor(parse_workers=1)),
+        (
+            f"on {max(os.cpu_count() or 1, 2)} parse processes",
+            LocalExtractor(parse_workers=max(os.cpu_count() or 1, 2)),
+        ),
+    ]:
+        start_time = time.time()
+        extracted = list(extractor.extract(urls))
+        elapsed = time.time() - start_time
+        print(f"Parsed {name}: {len(extracted)} pages in {elapsed:.2f}s ({len(extracted) / elapsed:.1f} pages/sec)")
+    print(extracted[0][0]["data"][:300])
+
+    if len(sys.argv) > 2:
+
+        def extract_remote(batch):
+            response = requests.post(sys.argv[2], json={"urls": batch}, stream=True)
+            return sum(1 for line in response.iter_lines() if line and json.loads(line))
+
+        # Same batching and concurrency as iter_website
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            extracted = sum(executor.map(extract_remote, [urls[i : i + 16] for i in range(0, len(urls), 16)]))
+        elapsed = time.time() - start_time
+        print(f"Extract endpoint: {extracted} pages in {elapsed:.2f}s ({extracted / elapsed:.1f} pages/sec)")
+    server.shutdown()
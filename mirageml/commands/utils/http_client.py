@@ -0,0 +1,303 @@
+import gzip
+import json
+import random
+import threading
+import time
+
+import requests
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from ...constants import (
+    LLM_GPT_ENDPOINT,
+    VECTORDB_CREATE_ENDPOINT,
+    VECTORDB_DELETE_ENDPOINT,
+    VECTORDB_LIST_ENDPOINT,
+    VECTORDB_SEARCH_ENDPOINT,
+    VECTORDB_UPSERT_ENDPOINT,
+    WEB_SCRAPE_EXTRACT_ENDPOINT,
+    WEB_SCRAPE_LINKS_ENDPOINT,
+)
+
+# Hosts with a pool of kept-alive connections, and connections kept open per host. The pool fits the most requests
+# any caller runs at once (the local extractor's fetches, the remote limiter's cap), more still go out but are closed
+# after use.
+POOL_HOSTS = 16
+POOL_SIZE = 64
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# (connect, read) timeouts in seconds. For streamed responses the read timeout is the longest gap between lines.
+DEFAULT_TIMEOUT = (5, 60)
+ENDPOINT_TIMEOUTS = {
+    VECTORDB_SEARCH_ENDPOINT: (5, 60),
+    VECTORDB_LIST_ENDPOINT: (5, 30),
+    VECTORDB_DELETE_ENDPOINT: (5, 60),
+    # Creating a collection from a url crawls the site before the first line comes back
+    VECTORDB_CREATE_ENDPOINT: (5, 300),
+    VECTORDB_UPSERT_ENDPOINT: (5, 300),
+    WEB_SCRAPE_LINKS_ENDPOINT: (5, 300),
+    WEB_SCRAPE_EXTRACT_ENDPOINT: (5, 300),
+    LLM_GPT_ENDPOINT: (5, 300),
+}
+# POST endpoints that can be called again without side effects. Creating, upserting and LLM calls are left out.
+IDEMPOTENT_ENDPOINTS = {
+    VECTORDB_SEARCH_ENDPOINT,
+    VECTORDB_LIST_ENDPOINT,
+    VECTORDB_DELETE_ENDPOINT,
+    WEB_SCRAPE_LINKS_ENDPOINT,
+    WEB_SCRAPE_EXTRACT_ENDPOINT,
+}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# JSON bodies for these endpoints are compressed once they are at least COMPRESSION_THRESHOLD bytes
+COMPRESSED_ENDPOINTS = {VECTORDB_CREATE_ENDPOINT, VECTORDB_UPSERT_ENDPOINT, VECTORDB_SEARCH_ENDPOINT}
+COMPRESSION_THRESHOLD = 16 * 1024
+# Best first, an endpoint that rejects one is sent the next from then on
+ENCODINGS = (["zstd"] if zstandard else []) + ["gzip"]
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Answers to a compressed body that can mean the endpoint couldn't read it. A 415 always does. A server without
+# decompression answers 400/422 because it can't parse the JSON, with a message that varies by framework, so the body
+# is sent again uncompressed and the encoding is only dropped if that goes through.
+REJECTED_ENCODING_STATUS = 415
+DECODE_ERROR_STATUSES = {400, 422}
+
+_session = None
+_compression_enabled = None
+_session_lock = threading.Lock()
+# Encoding each endpoint accepts, None once it has rejected all of them
+_endpoint_encodings = {}
+_stats = {"raw_bytes": 0, "wire_bytes": 0, "compress_time": 0.0}
+_stats_lock = threading.Lock()
+
+
+def get_session():
+    """The requests session shared by every service call, so connections are kept alive and reused."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def backoff(attempt):
+    """Seconds to wait before retry number attempt, exponential with full jitter so clients don't retry in step."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def compress(body, encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def _endpoint_encoding(url):
+    with _stats_lock:
+        return _endpoint_encodings.get(url, ENCODINGS[0])
+
+
+def _accepted_encodings(response):
+    """The encodings listed in the response's Accept-Encoding header (RFC 7694), or None without one."""
+    accepted = response.headers.get("Accept-Encoding")
+    if accepted is None:
+        return None
+    return {value.split(";")[0].strip().lower() for value in accepted.split(",")}
+
+
+def _reject_encoding(url, encoding, accepted=None):
+    """Move url on to the next encoding, or to one of the accepted encodings if the endpoint listed them."""
+    with _stats_lock:
+        if _endpoint_encodings.get(url, ENCODINGS[0]) == encoding:
+            remaining = ENCODINGS[ENCODINGS.index(encoding) + 1 :]
+            if accepted is not None:
+                remaining = [other for other in remaining if other in accepted]
+            _endpoint_encodings[url] = remaining[0] if remaining else None
+
+
+def _record(raw_bytes, wire_bytes, compress_time=0.0):
+    with _stats_lock:
+        _stats["raw_bytes"] += raw_bytes
+        _stats["wire_bytes"] += wire_bytes
+        _stats["compress_time"] += compress_time
+
+
+def _send(session, method, url, compress_body, **kwargs):
+    """Send one request, compressing its JSON body if asked and falling back when the endpoint rejects the encoding."""
+    if kwargs.get("json") is None:
+        return session.request(method, url, **kwargs)
+
+    body = json.dumps(kwargs.pop("json")).encode("utf-8")
+    headers = dict(kwargs.pop("headers", None) or {}, **{"Content-Type": "application/json"})
+    while True:
+        encoding = _endpoint_encoding(url) if compress_body and len(body) >= COMPRESSION_THRESHOLD else None
+        if not encoding:
+            response = session.request(method, url, data=body, headers=headers, **kwargs)
+            _record(len(body), len(body))
+            return response
+
+        start_time = time.perf_counter()
+        data = compress(body, encoding)
+        elapsed = time.perf_counter() - start_time
+        response = session.request(
+            method, url, data=data, headers=dict(headers, **{"Content-Encoding": encoding}), **kwargs
+        )
+        _record(len(body), len(data), elapsed)
+        if response.status_code != REJECTED_ENCODING_STATUS and response.status_code not in DECODE_ERROR_STATUSES:
+            return response
+        response.close()
+
+        accepted = _accepted_encodings(response)
+        if response.status_code == REJECTED_ENCODING_STATUS or (accepted is not None and encoding not in accepted):
+            _reject_encoding(url, encoding, accepted)
+            continue
+
+        # Nothing was done with a body that couldn't be parsed, so even a create or upsert can be sent again
+        plain = session.request(method, url, data=body, headers=headers, **kwargs)
+        _record(len(body), len(body))
+        if plain.status_code < 400:
+            _reject_encoding(url, encoding)
+        return plain
+
+
+def compression_enabled():
+    """Whether request bodies are compressed at all, only once request_compression is set in the config."""
+    global _compression_enabled
+    if _compression_enabled is None:
+        from ..config import load_config
+
+        _compression_enabled = bool(load_config().get("request_compression", False))
+    return _compression_enabled
+
+
+def compression_stats():
+    """Bytes of JSON request bodies before and after compression, and seconds spent compressing, since the start."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def request(method, url, timeout=None, retries=None, compress_body=None, **kwargs):
+    """
+    Send a request on the shared session, like requests.request.
+
+    Idempotent calls are retried up to `retries` times (MAX_RETRIES by default) on connection errors and
+    5xx/429 responses. Other calls are only retried when the connection couldn't be opened, since nothing
+    was sent. Streamed responses are returned as soon as their status is known and are never retried mid-stream.
+
+    JSON bodies are compressed for COMPRESSED_ENDPOINTS when the request_compression setting is on, unless
+    compress_body says otherwise.
+    """
+    method = method.upper()
+    if timeout is None:
+        timeout = ENDPOINT_TIMEOUTS.get(url, DEFAULT_TIMEOUT)
+    idempotent = method in IDEMPOTENT_METHODS or url in IDEMPOTENT_ENDPOINTS
+    if retries is None:
+        retries = MAX_RETRIES
+    if compress_body is None:
+        compress_body = url in COMPRESSED_ENDPOINTS and compression_enabled()
+    session = get_session()
+
+    attempt = 0
+    while True:
+        try:
+            response = _send(session, method, url, compress_body, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= retries or not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                raise
+        else:
+            if not idempotent or attempt >= retries or response.status_code not in RETRY_STATUSES:
+                return response
+            response.close()
+        time.sleep(backoff(attempt))
+        attempt += 1
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
+
+
+if __name__ == "__main__":
+    import sys
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from .local_source import iter_documents
+
+    # e.g. python -m mirageml.commands.utils.http_client [dir] [uplink Mbit/s], posts the files under dir in batches
+    # of 64 to a local mock endpoint that takes as long to receive a body as the uplink would
+    uplink = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    accepted_encodings = set()
+
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(len(body) * 8 / (uplink * 1e6))
+            encoding = self.headers.get("Content-Encoding")
+            status = 200
+            if encoding and encoding not in accepted_encodings:
+                status = 415
+            else:
+                if encoding == "gzip":
+                    body = gzip.decompress(body)
+                elif encoding == "zstd":
+                    body = zstandard.ZstdDecompressor().decompress(body, max_output_size=1024**3)
+                json.loads(body)
+            self.send_response(status)
+            self.send_header("Accept-Encoding", ", ".join(sorted(accepted_encodings)))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    documents = list(iter_documents(sys.argv[1] if len(sys.argv) > 1 else "."))
+    batches = [documents[i : i + 64] for i in range(0, len(documents), 64)]
+    print(f"{len(documents)} documents in {len(batches)} requests, uplink {uplink:g} Mbit/s")
+
+    for name, encodings, accepted in [
+        ("plain", [], set()),
+        ("gzip", ["gzip"], {"gzip"}),
+        ("zstd", ["zstd"], {"zstd"}),
+        ("zstd, endpoint only takes gzip", ["zstd", "gzip"], {"gzip"}),
+    ]:
+        if "zstd" in encodings and zstandard is None:
+            print(f"{name}: install zstandard to compare")
+            continue
+        ENCODINGS[:] = encodings or ["gzip"]
+        accepted_encodings.clear()
+        accepted_encodings.update(accepted)
+        _endpoint_encodings.clear()
+        url = f"http://127.0.0.1:{server.server_port}/{name.split(',')[0]}"
+        before, start_time = compression_stats(), time.time()
+        for batch in batches:
+            json_data = {"data": [data for data, _ in batch], "metadata": [metadata for _, metadata in batch]}
+            post(url, json=json_data, compress_body=bool(encodings)).raise_for_status()
+        elapsed = time.time() - start_time
+        sent = {key: value - before[key] for key, value in compression_stats().items()}
+        print(
+            f"{name}: {sent['raw_bytes'] / 1024**2:.2f} MB sent as {sent['wire_bytes'] / 1024**2:.2f} MB "
+            f"({sent['raw_bytes'] / max(sent['wire_bytes'], 1):.1f}x) in {elapsed:.2f}s, "
+            f"{sent['compress_time']:.2f}s compressing"
+        )
+    server.shutdown()
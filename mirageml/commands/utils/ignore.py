@@ -0,0 +1,134 @@
+import os
+import re
+
+IGNORE_FILES = (".gitignore", ".mirageignore")
+
+# Applied below every indexed root before any ignore file, so a `!pattern` in .mirageignore can re-include them
+DEFAULT_IGNORE_PATTERNS = [
+    "node_modules/",
+    "bower_components/",
+    "venv/",
+    "__pycache__/",
+    "*.egg-info/",
+    "site-packages/",
+    "build/",
+    "dist/",
+    "vendor/",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "package-lock.json",
+    "yarn.lock",
+    "poetry.lock",
+]
+
+
+def _translate(pattern):
+    """Translate a gitignore glob into a regex over '/'-separated paths relative to the ignore file's directory."""
+    # A slash anywhere but the end anchors the pattern to the ignore file's directory
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    regex, i = "", 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1 : end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            regex += "[" + body.replace("\\", "\\\\") + "]"
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    return re.compile(("" if anchored else "(?:.*/)?") + regex + "$")
+
+
+def parse_rules(lines):
+    """Return (regex, negate, dir_only) for every pattern in the lines of an ignore file."""
+    rules = []
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line.endswith("\\ "):
+            line = line.rstrip()
+        if not line or line.startswith("#"):
+            continue
+
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if line:
+            rules.append((_translate(line), negate, dir_only))
+    return rules
+
+
+class IgnoreMatcher:
+    """
+    Decides which paths under root are ignored, following .gitignore semantics.
+
+    Rules come from DEFAULT_IGNORE_PATTERNS and from every .gitignore and .mirageignore between
+    root and the path. Deeper files take precedence, and within a file the last matching pattern wins.
+    """
+
+    def __init__(self, root, default_patterns=DEFAULT_IGNORE_PATTERNS):
+        self.root = os.path.abspath(root)
+        self._default_rules = parse_rules(default_patterns)
+        self._rules = {}
+
+    def _rules_for(self, dirpath):
+        if dirpath not in self._rules:
+            rules = list(self._default_rules) if dirpath == self.root else []
+            for ignore_file in IGNORE_FILES:
+                try:
+                    with open(os.path.join(dirpath, ignore_file), encoding="utf-8") as f:
+                        rules.extend(parse_rules(f))
+                except (OSError, UnicodeDecodeError):
+                    continue
+            self._rules[dirpath] = rules
+        return self._rules[dirpath]
+
+    def is_ignored(self, path, is_dir=False):
+        """Whether path matches the rules itself, assuming its parent directory is not ignored."""
+        parts = os.path.relpath(os.path.abspath(path), self.root).split(os.sep)
+        ignored = False
+        dirpath = self.root
+        for depth in range(len(parts)):
+            relpath = "/".join(parts[depth:])
+            for regex, negate, dir_only in self._rules_for(dirpath):
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(relpath):
+                    ignored = not negate
+            dirpath = os.path.join(dirpath, parts[depth])
+        return ignored
+
+    def is_path_ignored(self, path):
+        """Whether path or any directory between root and path is ignored."""
+        parts = os.path.relpath(os.path.abspath(path), self.root).split(os.sep)
+        if parts[0] == "..":
+            return False
+        for depth in range(1, len(parts)):
+            if self.is_ignored(os.path.join(self.root, *parts[:depth]), is_dir=True):
+                return True
+        return self.is_ignored(path, is_dir=os.path.isdir(path))
@@ -0,0 +1,146 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+OVERLOAD_STATUSES = {429, 500, 502, 503, 504}
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 32
+# Fraction of the limit kept after an overload, and how much slower than usual a request has to be to count as one
+DECREASE_FACTOR = 0.5
+LATENCY_TOLERANCE = 3.0
+# The unloaded latency is the fastest request among roughly the last LATENCY_WINDOW, so it can follow a slower link
+LATENCY_WINDOW = 100
+
+
+class AIMDLimiter:
+    """
+    Caps the requests in flight to a service, finding the cap as it goes like TCP congestion control.
+
+    Every request that completes at a normal latency grows the limit by 1/limit, so by about one request per
+    round of requests. A 429/5xx answer, an error or a request taking LATENCY_TOLERANCE times the unloaded
+    latency cuts it by DECREASE_FACTOR, at most once per unloaded latency so one slow round only counts once.
+    Requests queueing up at the service show up as rising latency before it starts refusing them.
+    """
+
+    def __init__(
+        self,
+        initial=INITIAL_CONCURRENCY,
+        min_limit=1,
+        max_limit=MAX_CONCURRENCY,
+        decrease_factor=DECREASE_FACTOR,
+        latency_tolerance=LATENCY_TOLERANCE,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.latency = None
+        self._window_latency, self._window_count = None, 0
+        self.completed, self.items, self.overloads = 0, 0, 0
+        self._started, self._last_decrease = None, 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            if self._started is None:
+                self._started = time.monotonic()
+        return time.monotonic()
+
+    def release(self, start_time, overloaded=False, items=1):
+        now = time.monotonic()
+        latency = now - start_time
+        with self._cond:
+            self.in_flight -= 1
+            self.completed += 1
+            self.items += items
+            spike = self.latency is not None and latency > self.latency * self.latency_tolerance
+            if overloaded or spike:
+                if now - self._last_decrease > (self.latency or latency):
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                    self.overloads += 1
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if not overloaded:
+                self._observe_latency(latency)
+            self._cond.notify_all()
+
+    def _observe_latency(self, latency):
+        # The minimum of the current window and the one before it, so the baseline never drops to nothing
+        self._window_latency = latency if self._window_latency is None else min(self._window_latency, latency)
+        self._window_count += 1
+        self.latency = self._window_latency if self.latency is None else min(self.latency, self._window_latency)
+        if self._window_count >= LATENCY_WINDOW:
+            self.latency = self._window_latency
+            self._window_latency, self._window_count = None, 0
+
+    @contextmanager
+    def slot(self, items=1):
+        """
+        Hold one of the slots for a request, e.g. `with limiter.slot() as slot: slot.check(post(...))`.
+
+        Connection errors, timeouts and responses passed to slot.check with an overload status count against the
+        limit.
+        items is the number of things the request carries, for the throughput.
+        """
+        slot = Slot()
+        start_time = self.acquire()
+        try:
+            yield slot
+        except (requests.ConnectionError, requests.Timeout):
+            slot.overloaded = True
+            raise
+        finally:
+            self.release(start_time, slot.overloaded, items)
+
+    @property
+    def concurrency(self):
+        return int(self.limit)
+
+    def throughput(self):
+        """Items per second since the first request."""
+        with self._cond:
+            if self._started is None:
+                return 0.0
+            return self.items / max(time.monotonic() - self._started, 1e-6)
+
+    def report(self):
+        return (
+            f"Concurrency: {self.concurrency} requests in flight (max {self.max_limit}), {self.completed} requests, "
+            f"{self.overloads} backoffs, {self.throughput():.1f} items/sec"
+        )
+
+
+class Slot:
+    def __init__(self):
+        self.overloaded = False
+
+    def check(self, response):
+        self.overloaded = response.status_code in OVERLOAD_STATUSES
+        return response
+
+
+# Keyed by kind of request, since searches and uploads take very different times and need their own latency baseline
+_remote_limiters = {}
+_remote_limiters_lock = threading.Lock()
+
+
+def get_remote_limiter(kind):
+    """The limiter shared by every request of one kind ("search" or "upload") to the remote vectordb."""
+    with _remote_limiters_lock:
+        if kind not in _remote_limiters:
+            from ..config import load_config
+
+            config = load_config()
+            _remote_limiters[kind] = AIMDLimiter(
+                initial=config.get("remote_initial_concurrency", INITIAL_CONCURRENCY),
+                max_limit=config.get("remote_max_concurrency", MAX_CONCURRENCY),
+            )
+        return _remote_limiters[kind]
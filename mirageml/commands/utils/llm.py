@@ -1,79 +1,268 @@
 import os
 import sys
+import threading
+from collections import OrderedDict
 from io import StringIO
 
-import requests
-
 from ...constants import (
     LLM_GPT_ENDPOINT,
     get_headers,
 )
+from . import http_client
+from .chunker import Chunker
 
 PACKAGE_DIR = os.path.dirname(__file__)
 os.environ["TRANSFORMERS_CACHE"] = os.path.join(PACKAGE_DIR, "models")
 
 
-def _chunk_data(data, metadata):
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
+# Chunk size and overlap in tokens per embedding model, leaving room for [CLS] and [SEP] so chunks are never truncated
+EMBEDDING_CHUNK_SIZES = {
+    "BAAI/bge-base-en-v1.5": (510, 20),
+    "BAAI/bge-small-en-v1.5": (510, 20),
+}
+# A token is rarely longer than this, so longer texts are split before they are tokenized
+MAX_CHARS_PER_TOKEN = 16
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=2048, chunk_overlap=80)
-    docs = text_splitter.create_documents([data])
-    chunks = [x.page_content for x in docs]
-    meta = [{"data": curr_chunk, "source": metadata["source"]} for curr_chunk in chunks]
-    vector_data = local_get_embedding(chunks)
+_chunkers = {}
+_chunkers_lock = threading.Lock()
 
-    return chunks, meta, vector_data
 
+def get_chunker(embedding_model_id="BAAI/bge-base-en-v1.5"):
+    """Return a Chunker that measures chunks with the embedding model's own tokenizer."""
+    with _chunkers_lock:
+        if embedding_model_id not in _chunkers:
+            import copy
 
-def local_get_embedding(text_list, embedding_model_id="BAAI/bge-base-en-v1.5"):
-    from sentence_transformers import SentenceTransformer
+            model = get_embedding_model(embedding_model_id)
+            default_size = model.max_seq_length - 2
+            chunk_size, chunk_overlap = EMBEDDING_CHUNK_SIZES.get(
+                embedding_model_id, (default_size, default_size // 25)
+            )
 
-    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+            # A separate copy, since the model's tokenizer is reconfigured for every encode call on other threads
+            tokenizer = copy.deepcopy(model.tokenizer)
+
+            def length_function(text):
+                return len(tokenizer.encode(text, add_special_tokens=False, verbose=False))
+
+            def batch_length_function(texts):
+                encodings = tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+                return [len(input_ids) for input_ids in encodings]
+
+            _chunkers[embedding_model_id] = Chunker(
+                chunk_size,
+                chunk_overlap,
+                length_function,
+                batch_length_function=batch_length_function,
+                max_chars=chunk_size * MAX_CHARS_PER_TOKEN,
+            )
+        return _chunkers[embedding_model_id]
+
+
+def _chunk_data(data, metadata, embedding_model_id="BAAI/bge-base-en-v1.5"):
+    chunks, meta = [], []
+    for curr_chunk, tokens in get_chunker(embedding_model_id).split_text_with_lengths(data, metadata["source"]):
+        chunks.append(curr_chunk)
+        meta.append({"data": curr_chunk, "source": metadata["source"], "tokens": tokens})
+
+    return chunks, meta
+
+
+def embed_chunks(chunks, batch_size=64, on_batch=None, workers=1):
+    """
+    Embed chunks gathered from any number of documents, returning vectors in input order.
+
+    Chunks are encoded in batches of similar length to keep padding waste low. With workers > 1,
+    each step hands one batch to every process in the embedding pool.
+    on_batch(done, total) is called after each step.
+    """
+    order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]))
+    vectors = [None] * len(chunks)
+    step = batch_size * max(workers, 1)
+    for start in range(0, len(order), step):
+        batch = order[start : start + step]
+        embeddings = cached_local_get_embedding([chunks[i] for i in batch], batch_size=batch_size, workers=workers)
+        for i, embedding in zip(batch, embeddings):
+            vectors[i] = embedding
+        if on_batch:
+            on_batch(start + len(batch), len(order))
+    return vectors
+
+
+# Embedding models are expensive to load, so keep them resident for the lifetime of the process.
+# Entries are keyed by (model id, device) and evicted least-recently-used first once either limit is hit.
+EMBEDDING_MODEL_CACHE_SIZE = 2
+EMBEDDING_MODEL_CACHE_MAX_BYTES = 2 * 1024**3
+
+_embedding_models = OrderedDict()
+_embedding_models_lock = threading.Lock()
+
+
+def _model_nbytes(model):
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+
+def get_embedding_model(embedding_model_id="BAAI/bge-base-en-v1.5", device=None):
+    """Return the resident SentenceTransformer for a model id and device, loading it on first use."""
+    if device is None:
+        import torch
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    key = (embedding_model_id, device)
+
+    with _embedding_models_lock:
+        if key in _embedding_models:
+            _embedding_models.move_to_end(key)
+            return _embedding_models[key][0]
+
+        from sentence_transformers import SentenceTransformer
+
+        model_dir = os.path.join(PACKAGE_DIR, "models", embedding_model_id)
+        if not os.path.exists(model_dir):
+            os.makedirs(model_dir, exist_ok=True)
+            print("Downloading model to:", model_dir)
+            print("This will take a few minutes and only happen once!")
+
+        # Suppress stdout/stderr
+        original_stdout, original_stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            model = SentenceTransformer(embedding_model_id, cache_folder=model_dir, device=device)
+        finally:
+            # Restore stdout/stderr
+            sys.stdout, sys.stderr = original_stdout, original_stderr
+
+        _embedding_models[key] = (model, _model_nbytes(model))
 
-    model_dir = os.path.join(PACKAGE_DIR, "models", embedding_model_id)
-    if not os.path.exists(model_dir):
-        os.makedirs(model_dir, exist_ok=True)
-        print("Downloading model to:", model_dir)
-        print("This will take a few minutes and only happen once!")
+        # Evict the least recently used models, but never the one that was just loaded
+        while len(_embedding_models) > 1 and (
+            len(_embedding_models) > EMBEDDING_MODEL_CACHE_SIZE
+            or sum(nbytes for _, nbytes in _embedding_models.values()) > EMBEDDING_MODEL_CACHE_MAX_BYTES
+        ):
+            _embedding_models.popitem(last=False)
+        return model
 
-    # TODO: Suppress stdout/stderr
-    original_stdout, original_stderr = sys.stdout, sys.stderr
-    sys.stdout, sys.stderr = StringIO(), StringIO()
 
-    model = SentenceTransformer(embedding_model_id, cache_folder=model_dir)
-    embeddings = model.encode(text_list, normalize_embeddings=False)
+_embedding_pools = {}
+_embedding_pools_lock = threading.Lock()
 
-    # Restore stdout/stderr
-    sys.stdout, sys.stderr = original_stdout, original_stderr
+
+def get_embedding_pool(embedding_model_id="BAAI/bge-base-en-v1.5", workers=2):
+    """Start (once per process) a pool of CPU worker processes that each hold a copy of the embedding model."""
+    key = (embedding_model_id, workers)
+    with _embedding_pools_lock:
+        if key not in _embedding_pools:
+            import atexit
+
+            model = get_embedding_model(embedding_model_id, device="cpu")
+
+            # Split the cores between the workers instead of letting every worker claim all of them
+            original_threads = os.environ.get("OMP_NUM_THREADS")
+            os.environ["OMP_NUM_THREADS"] = str(max((os.cpu_count() or 1) // workers, 1))
+            try:
+                pool = model.start_multi_process_pool(target_devices=["cpu"] * workers)
+            finally:
+                if original_threads is None:
+                    del os.environ["OMP_NUM_THREADS"]
+                else:
+                    os.environ["OMP_NUM_THREADS"] = original_threads
+
+            atexit.register(model.stop_multi_process_pool, pool)
+            _embedding_pools[key] = pool
+        return _embedding_pools[key]
+
+
+def local_get_embedding(text_list, embedding_model_id="BAAI/bge-base-en-v1.5", batch_size=32, workers=1):
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    if workers > 1 and len(text_list) > batch_size:
+        # Shard the texts across the worker processes, results come back in input order
+        pool = get_embedding_pool(embedding_model_id, workers)
+        model = get_embedding_model(embedding_model_id, device="cpu")
+        embeddings = model.encode_multi_process(text_list, pool, batch_size=batch_size, chunk_size=batch_size)
+    else:
+        model = get_embedding_model(embedding_model_id)
+        embeddings = model.encode(text_list, batch_size=batch_size, normalize_embeddings=False, show_progress_bar=False)
 
     # Convert the embeddings to a list
     embeddings = embeddings.tolist()  # size = 768
     return embeddings
 
 
-def local_llm_call(messages, llm_model_id="TheBloke/Llama-2-7b-Chat-GGUF", stream=False):
-    from ctransformers import AutoModelForCausalLM
+def cached_local_get_embedding(text_list, embedding_model_id="BAAI/bge-base-en-v1.5", batch_size=32, workers=1):
+    """Embed text_list, only running the model on texts that are not in the on-disk embedding cache."""
+    from .embedding_cache import get_embedding_cache
 
-    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    cache = get_embedding_cache(embedding_model_id)
+    embeddings = cache.get_many(text_list)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        missing_text = [text_list[i] for i in missing]
+        missing_embeddings = local_get_embedding(
+            missing_text, embedding_model_id, batch_size=batch_size, workers=workers
+        )
+        cache.put_many(missing_text, missing_embeddings)
+        for i, embedding in zip(missing, missing_embeddings):
+            embeddings[i] = embedding
+    return embeddings
 
-    model_dir = os.path.join(PACKAGE_DIR, "models", llm_model_id)
-    if not os.path.exists(model_dir):
-        os.makedirs(model_dir, exist_ok=True)
-        print("Downloading model to:", model_dir)
-        print("This will take a few minutes and only happen once!")
 
-    # Suppress stdout/stderr
-    original_stdout, original_stderr = sys.stdout, sys.stderr
-    sys.stdout, sys.stderr = StringIO(), StringIO()
+_llm_models = {}
+_llm_models_lock = threading.Lock()
 
-    llm = AutoModelForCausalLM.from_pretrained(
-        "TheBloke/Llama-2-7b-Chat-GGUF",
-        model_file="llama-2-7b-chat.Q4_K_M.gguf",
-        model_type="llama",
-    )
 
-    # Restore stdout/stderr
-    sys.stdout, sys.stderr = original_stdout, original_stderr
+def get_local_llm(llm_model_id="TheBloke/Llama-2-7b-Chat-GGUF", quiet=True):
+    """Return the resident ctransformers model, loading it on first use."""
+    with _llm_models_lock:
+        if llm_model_id in _llm_models:
+            return _llm_models[llm_model_id]
+
+        from ctransformers import AutoModelForCausalLM
+
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+        model_dir = os.path.join(PACKAGE_DIR, "models", llm_model_id)
+        if not os.path.exists(model_dir):
+            os.makedirs(model_dir, exist_ok=True)
+            print("Downloading model to:", model_dir)
+            print("This will take a few minutes and only happen once!")
+
+        # Suppress stdout/stderr
+        original_stdout, original_stderr = sys.stdout, sys.stderr
+        if quiet:
+            sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            llm = AutoModelForCausalLM.from_pretrained(
+                llm_model_id,
+                model_file="llama-2-7b-chat.Q4_K_M.gguf",
+                model_type="llama",
+            )
+        finally:
+            # Restore stdout/stderr
+            sys.stdout, sys.stderr = original_stdout, original_stderr
+
+        _llm_models[llm_model_id] = llm
+        return llm
+
+
+def prewarm_local_llm(llm_model_id="TheBloke/Llama-2-7b-Chat-GGUF"):
+    """Start loading the local LLM in a background thread so the first chat turn doesn't pay for it."""
+
+    def load():
+        try:
+            # Swapping sys.stdout from a background thread would hide the chat prompt, so load loudly
+            get_local_llm(llm_model_id, quiet=False)
+        except Exception:
+            # The chat turn that needs the model will load it again and surface the error
+            pass
+
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    return thread
+
+
+def local_llm_call(messages, llm_model_id="TheBloke/Llama-2-7b-Chat-GGUF", stream=False):
+    llm = get_local_llm(llm_model_id)
     formatted_messages = "\n".join([x["content"] for x in messages])
 
     if stream:
@@ -90,4 +279,4 @@ def llm_call(messages, model="gpt-3.5-turbo", stream=False, local=False):
     if local:
         return local_llm_call(messages, stream=stream)
     json_data = {"model": model, "messages": messages, "stream": stream}
-    return requests.post(LLM_GPT_ENDPOINT, json=json_data, headers=get_headers(), stream=stream)
+    return http_client.post(LLM_GPT_ENDPOINT, json=json_data, headers=get_headers(), stream=stream)
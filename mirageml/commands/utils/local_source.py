@@ -1,40 +1,146 @@
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import typer
 
+from .ignore import IgnoreMatcher
+
+# Only the first few KB of a file are read to decide whether it's text
+SNIFF_BYTES = 8192
+MAX_FILE_BYTES = 1024**2
+MAX_TOTAL_BYTES = 512 * 1024**2
+READ_WORKERS = 8
+# Number of files that can be read ahead of the consumer
+READ_WINDOW = 64
 
-def crawl_files(start_dir="."):
-    file_data = []
 
-    # Walk through the directory structure
+def walk_files(start_dir="."):
+    """Yield the path of every file under start_dir that isn't hidden or excluded by ignore rules."""
     if os.path.isfile(start_dir):
-        try:
-            # Read the file content
-            with open(start_dir, "r", encoding="utf-8") as file:
-                file_content = file.read()
-                file_data.append((file_content, start_dir))
-        except Exception:
-            # If unable to read a file, you can print an error or continue to the next file
-            typer.secho(f"Unable to read file: {start_dir}", fg=typer.colors.BRIGHT_RED, bold=True)
+        yield start_dir
     elif not os.path.isdir(start_dir):
         typer.secho(f"Unable to read dir: {start_dir}", fg=typer.colors.BRIGHT_RED, bold=True)
     else:
-        for dirpath, dirnames, filenames in os.walk(os.path.abspath(start_dir)):
+        matcher = IgnoreMatcher(start_dir)
+        for dirpath, dirnames, filenames in os.walk(matcher.root):
+            # Prune hidden and ignored directories in place so they are never descended into
+            dirnames[:] = [
+                dirname
+                for dirname in dirnames
+                if not dirname.startswith(".") and not matcher.is_ignored(os.path.join(dirpath, dirname), is_dir=True)
+            ]
             for filename in filenames:
                 # Skip hidden files
-                if filename.startswith(".") or dirpath.split("/")[-1].startswith("."):
+                if filename.startswith("."):
                     continue
                 filepath = os.path.join(dirpath, filename)
+                if not matcher.is_ignored(filepath):
+                    yield filepath
+
+
+def is_binary(head):
+    if b"\0" in head:
+        return True
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sniffed bytes is still text
+        return e.start < len(head) - 3
+    return False
+
+
+def read_file(filepath):
+    """Return the text content of filepath, or None if it is binary or can't be read as UTF-8."""
+    try:
+        with open(filepath, "rb") as file:
+            head = file.read(SNIFF_BYTES)
+            if is_binary(head):
+                return None
+            return (head + file.read()).decode("utf-8")
+    except Exception:
+        return None
+
+
+def iter_files(
+    start_dir=".",
+    skip=None,
+    max_file_bytes=MAX_FILE_BYTES,
+    max_total_bytes=MAX_TOTAL_BYTES,
+    workers=READ_WORKERS,
+    window=READ_WINDOW,
+    filepaths=None,
+    unread=None,
+):
+    """
+    Yield (filepath, stat, content) for every readable text file under start_dir, in walk order.
+
+    Files are read on a thread pool with at most `window` reads in flight. Files larger than
+    max_file_bytes are skipped, and the crawl stops once max_total_bytes have been read.
+    skip(filepath, stat) can return True to leave a file out without reading it.
+    Pass filepaths to read those files instead of walking start_dir.
+    With unread, the walk goes on past max_total_bytes and unread(filepath, stat) is called for each file
+    that is left unread, so a caller can tell them from files that are gone.
+    """
+    total_bytes, stopped = 0, False
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for filepath in walk_files(start_dir) if filepaths is None else filepaths:
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            if skip and skip(filepath, stat):
+                continue
+            if stat.st_size > max_file_bytes:
+                continue
+            if stopped:
+                unread(filepath, stat)
+                continue
+            total_bytes += stat.st_size
+            if total_bytes > max_total_bytes:
+                typer.secho(
+                    f"Stopped reading {start_dir} after {max_total_bytes // 1024**2} MB",
+                    fg=typer.colors.BRIGHT_RED,
+                    bold=True,
+                )
+                if unread is None:
+                    break
+                stopped = True
+                unread(filepath, stat)
+                continue
+
+            pending.append((filepath, stat, executor.submit(read_file, filepath)))
+            if len(pending) >= window:
+                filepath, stat, future = pending.popleft()
+                content = future.result()
+                if content is not None:
+                    yield filepath, stat, content
+
+        while pending:
+            filepath, stat, future = pending.popleft()
+            content = future.result()
+            if content is not None:
+                yield filepath, stat, content
+
+
+def iter_documents(start_dir="."):
+    """
+    Yield (data, metadata) for every readable text file under start_dir, as crawl_files would return them.
+
+    metadata carries the file's content as "data" too, it is part of the payload the remote vectordb endpoints take.
+    """
+    for filepath, _, content in iter_files(start_dir):
+        yield filepath + ": " + content, {"data": content, "source": filepath}
+
+
+def crawl_files(start_dir="."):
+    data, metadata = [], []
+    for document, document_metadata in iter_documents(start_dir):
+        data.append(document)
+        metadata.append(document_metadata)
 
-                try:
-                    # Read the file content
-                    with open(filepath, "r", encoding="utf-8") as file:
-                        file_content = file.read()
-                        file_data.append((file_content, filepath))
-                except Exception:
-                    # If unable to read a file, you can print an error or continue to the next file
-                    pass
-
-    data = [x[1] + ": " + x[0] for x in file_data]
-    metadata = [dict({"data": x[0]}, **{"source": x[1]}) for x in file_data]
+    if not data and os.path.isfile(start_dir):
+        # If unable to read a file, you can print an error or continue to the next file
+        typer.secho(f"Unable to read file: {start_dir}", fg=typer.colors.BRIGHT_RED, bold=True)
     return data, metadata
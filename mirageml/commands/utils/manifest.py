@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+
+PACKAGE_DIR = os.path.dirname(__file__)
+MANIFEST_DIR = os.path.join(PACKAGE_DIR, "manifests")
+
+
+def hash_document(text):
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def manifest_path(collection_name):
+    return os.path.join(MANIFEST_DIR, f"{collection_name}.json")
+
+
+def links_checkpoint_path(collection_name):
+    """File of the links discovered so far by an unfinished crawl for a web source."""
+    return os.path.join(MANIFEST_DIR, f"{collection_name}.links")
+
+
+def load_manifest(collection_name):
+    """
+    Return the manifest of a local collection, or None if it was indexed without one.
+
+    {"path": <indexed root>, "files": {<source>: {"size", "mtime", "hash", "ids"}}}, or for a web source
+    {"url": <crawled url>, "files": {<page url>: {"hash", "ids"}}}
+
+    While indexing is in progress it also has "pending_ids", points that may not be referenced anymore.
+    """
+    path = manifest_path(collection_name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(collection_name, manifest):
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    path = manifest_path(collection_name)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def delete_manifest(collection_name):
+    for path in (manifest_path(collection_name), links_checkpoint_path(collection_name)):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,144 @@
+import hashlib
+import re
+from collections import Counter
+
+import numpy as np
+
+# A block on at least this fraction of the pages (and at least BOILERPLATE_MIN_PAGES) is treated as boilerplate
+BOILERPLATE_MIN_FRACTION = 0.5
+BOILERPLATE_MIN_PAGES = 3
+# Pages held back at the start of a crawl to learn the boilerplate from
+BOILERPLATE_SAMPLE_PAGES = 32
+# Pages whose 64-bit simhashes differ in at most this many bits are near-duplicates
+SIMHASH_MAX_DISTANCE = 6
+SHINGLE_SIZE = 3
+
+WORD = re.compile(r"\w+")
+
+
+def split_blocks(text):
+    """Split page text into paragraphs, or lines if it has no blank lines."""
+    separator = "\n\n" if "\n\n" in text else "\n"
+    return text.split(separator), separator
+
+
+def _block_key(block):
+    normalized = " ".join(block.split()).lower()
+    return hashlib.blake2b(normalized.encode("utf-8", "surrogatepass"), digest_size=8).digest() if normalized else None
+
+
+def simhash(text):
+    """64-bit Charikar simhash over word shingles, similar texts get hashes that differ in few bits."""
+    words = WORD.findall(text.lower())
+    shingles = [" ".join(words[i : i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))]
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), 64)
+    # A bit is set when more than half of the shingle hashes have it set
+    return int("".join("1" if count * 2 > len(shingles) else "0" for count in bits.sum(axis=0)), 2)
+
+
+class SimHashIndex:
+    """
+    Finds a previously added hash within max_distance bits of a new one.
+
+    Hashes are split into max_distance + 1 bands, and two hashes that close must agree on at least one
+    whole band, so only hashes sharing a band are compared instead of every pair.
+    """
+
+    def __init__(self, max_distance=SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self._buckets = {}
+
+    def _band_keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(band, value >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def find(self, value):
+        for key in self._band_keys(value):
+            for other, item in self._buckets.get(key, ()):
+                if bin(value ^ other).count("1") <= self.max_distance:
+                    return item
+        return None
+
+    def add(self, value, item):
+        for key in self._band_keys(value):
+            self._buckets.setdefault(key, []).append((value, item))
+
+
+class PageFilter:
+    """
+    Strips site-wide boilerplate blocks from a stream of crawled pages and drops near-duplicate pages.
+
+    A block is boilerplate once it has been seen on at least min_fraction of the pages so far, and on at
+    least min_pages of them. The first sample_size pages are held back so there is something to compare
+    against before any page is let through.
+    """
+
+    def __init__(
+        self,
+        sample_size=BOILERPLATE_SAMPLE_PAGES,
+        min_fraction=BOILERPLATE_MIN_FRACTION,
+        min_pages=BOILERPLATE_MIN_PAGES,
+    ):
+        self.sample_size = sample_size
+        self.min_fraction = min_fraction
+        self.min_pages = min_pages
+        self._block_counts = Counter()
+        self._index = SimHashIndex()
+        self.pages_in, self.dropped = 0, 0
+        self.total_chars, self.stripped_chars = 0, 0
+
+    def _is_boilerplate(self, key):
+        return self._block_counts[key] >= max(self.min_pages, self.pages_in * self.min_fraction)
+
+    def _count(self, text):
+        self.pages_in += 1
+        self._block_counts.update({_block_key(block) for block in split_blocks(text)[0]} - {None})
+
+    def _clean(self, text, meta):
+        """Return the page without boilerplate, or None if nothing is left or it's a near-duplicate."""
+        blocks, separator = split_blocks(text)
+        stripped = separator.join(block for block in blocks if not self._is_boilerplate(_block_key(block))).strip()
+        self.total_chars += len(text)
+        self.stripped_chars += len(text) - len(stripped)
+        if not stripped:
+            self.dropped += 1
+            return None
+
+        value = simhash(stripped)
+        if self._index.find(value) is not None:
+            self.dropped += 1
+            return None
+        self._index.add(value, meta.get("source"))
+        return stripped
+
+    def filter(self, pages):
+        """Yield the cleaned (data, metadata) of the pages worth indexing, in order."""
+        sample = []
+        for text, meta in pages:
+            self._count(text)
+            if sample is None:
+                yield from self._clean_all([(text, meta)])
+                continue
+            sample.append((text, meta))
+            if len(sample) >= self.sample_size:
+                yield from self._clean_all(sample)
+                sample = None
+        # Fewer pages than the sample
+        if sample:
+            yield from self._clean_all(sample)
+
+    def _clean_all(self, pages):
+        for text, meta in pages:
+            stripped = self._clean(text, meta)
+            if stripped is not None:
+                yield stripped, dict(meta, data=stripped) if "data" in meta else meta
+
+    def report(self):
+        boilerplate = sum(1 for key in self._block_counts if self._is_boilerplate(key))
+        return (
+            f"Web pages: {self.pages_in} crawled, {self.dropped} near-duplicate or empty pages dropped, "
+            f"{boilerplate} boilerplate blocks stripped ({self.stripped_chars / max(self.total_chars, 1):.0%} of the text)"
+        )
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+# How often blocked stages check whether the pipeline was stopped
+POLL_INTERVAL = 0.1
+
+
+class StageStats:
+    def __init__(self, name, queue_size):
+        self.name = name
+        self.queue_size = queue_size
+        self.items_in, self.items_out = 0, 0
+        self.elapsed, self.wait_time = 0.0, 0.0
+        self.max_depth, self.depth_total, self.depth_samples = 0, 0, 0
+
+    @property
+    def busy_time(self):
+        return max(self.elapsed - self.wait_time, 0.0)
+
+    def sample_depth(self, depth):
+        self.max_depth = max(self.max_depth, depth)
+        self.depth_total += depth
+        self.depth_samples += 1
+
+    def report(self):
+        rate = self.items_out / self.busy_time if self.busy_time else 0.0
+        line = f"{self.name}: {self.items_out} out in {self.busy_time:.1f}s busy ({rate:.1f}/sec)"
+        if self.depth_samples:
+            avg_depth = self.depth_total / self.depth_samples
+            line += f", input queue max {self.max_depth}/{self.queue_size} avg {avg_depth:.1f}"
+        return line
+
+
+class Pipeline:
+    """
+    Runs items from a source through a chain of stages, each stage on its own thread.
+
+    A stage is a function that takes an iterable of inputs and yields outputs, so it can batch,
+    split or drop items freely. Stages are joined by bounded queues, so they all make progress at
+    once while memory stays bounded by the queue sizes instead of the size of the input.
+    """
+
+    def __init__(self, source, name="source"):
+        self._stages = [(name, lambda _: source, 0)]
+        self._stop = threading.Event()
+        self._error = None
+        self.stats = []
+
+    def add_stage(self, name, fn, queue_size=64):
+        """Add a stage after the current last one, reading from a queue of at most queue_size items."""
+        self._stages.append((name, fn, queue_size))
+        return self
+
+    def _get(self, q, stats):
+        stats.sample_depth(q.qsize())
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return q.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+            return _DONE
+        finally:
+            stats.wait_time += time.perf_counter() - start
+
+    def _put(self, q, item, stats):
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    q.put(item, timeout=POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    continue
+        finally:
+            stats.wait_time += time.perf_counter() - start
+
+    def _run_stage(self, fn, in_queue, out_queue, stats):
+        def inputs():
+            while True:
+                item = self._get(in_queue, stats)
+                if item is _DONE:
+                    return
+                stats.items_in += 1
+                yield item
+
+        start = time.perf_counter()
+        outputs = fn(inputs() if in_queue else None)
+        try:
+            for output in outputs:
+                self._put(out_queue, output, stats)
+                stats.items_out += 1
+                if self._stop.is_set():
+                    break
+        except BaseException as e:
+            self._error = self._error or e
+            self._stop.set()
+        finally:
+            if hasattr(outputs, "close"):
+                outputs.close()
+            stats.elapsed = time.perf_counter() - start
+            self._put(out_queue, _DONE, stats)
+
+    def run(self, queue_size=1024, sink_name="sink"):
+        """
+        Start every stage and yield the outputs of the last one. Re-raises the first error from any stage.
+
+        The caller's loop over the outputs is the final stage, and is reported as sink_name. Work that has
+        to stay on the calling thread goes there.
+        """
+        sink_stats = StageStats(sink_name, queue_size)
+        self.stats = [StageStats(name, size) for name, _, size in self._stages] + [sink_stats]
+        queues = [queue.Queue(maxsize=size) for _, _, size in self._stages[1:]] + [queue.Queue(maxsize=queue_size)]
+
+        threads = []
+        for i, (name, fn, _) in enumerate(self._stages):
+            in_queue = queues[i - 1] if i else None
+            thread = threading.Thread(
+                target=self._run_stage, args=(fn, in_queue, queues[i], self.stats[i]), name=name, daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+
+        start = time.perf_counter()
+        try:
+            while True:
+                item = self._get(queues[-1], sink_stats)
+                if item is _DONE:
+                    break
+                sink_stats.items_in += 1
+                sink_stats.items_out += 1
+                yield item
+        finally:
+            # Also reached when the caller stops early or is interrupted
+            sink_stats.elapsed = time.perf_counter() - start
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        if self._error:
+            raise self._error
+
+    def report(self):
+        return [stats.report() for stats in self.stats]
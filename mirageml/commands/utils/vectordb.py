@@ -1,13 +1,16 @@
+import hashlib
 import json
 import os
+import threading
+import time
 import uuid
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 
 import keyring
-import requests
 import typer
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, PointStruct, VectorParams
+from qdrant_client.http.models import Distance, PointIdsList, PointStruct, VectorParams
 from rich.console import Console
 from rich.live import Live
 from rich.panel import Panel
@@ -22,15 +25,25 @@ from ...constants import (
     VECTORDB_UPSERT_ENDPOINT,
     get_headers,
 )
+from ..config import load_config
 from ..list_sources import set_sources
-from .llm import _chunk_data, local_get_embedding
-from .local_source import crawl_files
-from .web_source import crawl_website
+from . import http_client
+from .chunker import describe_chunk_lengths
+from .embedding_cache import get_embedding_cache
+from .limiter import get_remote_limiter
+from .llm import _chunk_data, embed_chunks, get_chunker, local_get_embedding
+from .local_source import iter_documents, iter_files
+from .manifest import delete_manifest, hash_document, links_checkpoint_path, load_manifest, save_manifest
+from .pipeline import Pipeline
+from .web_source import iter_website
 
 PACKAGE_DIR = os.path.dirname(__file__)
 
 progress = Progress()
 
+# How often the manifest is saved while indexing, so an interrupted run can resume
+CHECKPOINT_INTERVAL = 5.0
+
 
 def get_local_qdrant_db():
     QDRANT_LOCKFILE_PATH = os.path.join(PACKAGE_DIR, ".lock")
@@ -44,37 +57,113 @@ def exists_qdrant_db(collection_name="test"):
     return collection_name in [x.name for x in qdrant_client.get_collections().collections]
 
 
-def create_remote_qdrant_db(collection_name, link=None, path=None):
-    user_id = keyring.get_password(SERVICE_ID, "user_id")
-
-    if link:
-        data, metadata = None, None
-    if path:
-        data, metadata = crawl_files(path)
+def upload_points(qdrant_client, collection_name, vectors, payloads, ids=None, batch_size=256, on_batch=None):
+    """
+    Write points through the client's bulk upload path, batch_size points at a time.
 
-    def make_request(args):
-        i, curr_data, metadata_value, live = args
+    on_batch(done, total) is called after each batch. Returns the ids of the points, random ones unless given.
+    """
+    if ids is None:
+        ids = [uuid.uuid4().hex for _ in vectors]
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        qdrant_client.upload_collection(
+            collection_name=collection_name,
+            vectors=vectors[start:end],
+            payload=payloads[start:end],
+            ids=ids[start:end],
+            batch_size=batch_size,
+        )
+        if on_batch:
+            on_batch(min(end, len(ids)), len(ids))
+    return ids
+
+
+def batch_documents(documents, max_items=64, max_bytes=4 * 1024**2):
+    """
+    Pack (data, metadata) documents into lists of at most max_items documents and about max_bytes of JSON.
+
+    A document larger than max_bytes is sent in a batch of its own.
+    """
+    batch, size = [], 0
+    for data, metadata in documents:
+        document_size = len(data.encode("utf-8", "surrogatepass")) + len(json.dumps(metadata))
+        if batch and (len(batch) >= max_items or size + document_size > max_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append((data, metadata))
+        size += document_size
+    if batch:
+        yield batch
+
+
+def create_remote_qdrant_db(
+    collection_name,
+    link=None,
+    path=None,
+    create_endpoint=VECTORDB_CREATE_ENDPOINT,
+    upsert_endpoint=VECTORDB_UPSERT_ENDPOINT,
+    user_id=None,
+    headers=None,
+):
+    """
+    Index a website or local files into a remote collection.
+
+    Files are sent in batches bounded by remote_batch_size documents and remote_batch_bytes bytes. The first
+    batch creates the collection and is sent on its own, the rest are upserted once it has finished, with as
+    many requests in flight as the remote upload limiter allows.
+
+    user_id and headers default to the logged in user's, read from the keyring.
+    """
+    if user_id is None:
+        user_id = keyring.get_password(SERVICE_ID, "user_id")
+
+    def request_headers():
+        # Fetched for every request, so a token refreshed during a long upload is picked up
+        return get_headers() if headers is None else headers
+
+    config = load_config()
+    max_items = config.get("remote_batch_size", 64)
+    max_bytes = config.get("remote_batch_bytes", 4 * 1024**2)
+
+    stats = {"files": 0, "bytes": 0, "batches": 0}
+    stats_lock = threading.Lock()
+    limiter = get_remote_limiter("upload")
+    start_time, start_bytes = time.monotonic(), http_client.compression_stats()
+
+    def send_batch(endpoint, batch, live):
         json_data = {
             "user_id": user_id,
             "collection_name": collection_name,
-            "data": [curr_data],
-            "metadata": [metadata_value],
+            "data": [data for data, _ in batch],
+            "metadata": [metadata for _, metadata in batch],
         }
-        if i == 0:
-            response = requests.post(VECTORDB_CREATE_ENDPOINT, json=json_data, headers=get_headers(), stream=True)
-        else:
-            response = requests.post(VECTORDB_UPSERT_ENDPOINT, json=json_data, headers=get_headers(), stream=True)
-
-        if response.status_code == 200:
-            for chunk in response.iter_lines():
-                # process line here
-                live.update(
-                    Panel(
-                        f"Indexing: {chunk.decode()}",
-                        title="[bold green]Indexer[/bold green]",
-                        border_style="green",
-                    )
-                )
+        attempt = 0
+        while True:
+            with limiter.slot(items=len(batch)) as slot:
+                response = http_client.post(endpoint, json=json_data, headers=request_headers(), stream=True)
+                # A 429 means the batch wasn't taken, so it can be sent again once the limiter has backed off
+                if slot.check(response).status_code != 429 or attempt >= http_client.MAX_RETRIES:
+                    response.raise_for_status()
+                    # The batch is only done once the whole response is read
+                    for _ in response.iter_lines():
+                        pass
+                    break
+                response.close()
+            time.sleep(http_client.backoff(attempt))
+            attempt += 1
+
+        with stats_lock:
+            stats["files"] += len(batch)
+            stats["bytes"] += sum(len(data) for data, _ in batch)
+            stats["batches"] += 1
+            elapsed = max(time.monotonic() - start_time, 1e-6)
+            message = (
+                f"Indexing: batch {stats['batches']} ({len(batch)} files), {stats['files']} files sent, "
+                f"{stats['files'] / elapsed:.1f} files/sec, {stats['bytes'] / 1024**2 / elapsed:.2f} MB/sec, "
+                f"{limiter.concurrency} requests in flight"
+            )
+        live.update(Panel(message, title="[bold green]Indexer[/bold green]", border_style="green"))
 
     console = Console()
     with Live(
@@ -88,17 +177,13 @@ def create_remote_qdrant_db(collection_name, link=None, path=None):
         auto_refresh=True,
         vertical_overflow="visible",
     ) as live:
-        if data:
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                args_list = [(i, curr_data, metadata[i], live) for i, curr_data in enumerate(data)]
-                list(executor.map(make_request, args_list))
-        else:
+        if link:
             json_data = {
                 "user_id": user_id,
                 "collection_name": collection_name,
                 "url": link,
             }
-            response = requests.post(VECTORDB_CREATE_ENDPOINT, json=json_data, headers=get_headers(), stream=True)
+            response = http_client.post(create_endpoint, json=json_data, headers=request_headers(), stream=True)
             if response.status_code == 200:
                 for chunk in response.iter_lines():
                     # process line here
@@ -110,23 +195,307 @@ def create_remote_qdrant_db(collection_name, link=None, path=None):
                             border_style="green",
                         )
                     )
+        else:
+            batches = batch_documents(iter_documents(path), max_items=max_items, max_bytes=max_bytes)
+            first_batch = next(batches, None)
+            if first_batch is None:
+                typer.secho(f"No files to index under {path}", fg=typer.colors.BRIGHT_RED, bold=True)
+                return False
+            # Upserts can only go to a collection that exists
+            send_batch(create_endpoint, first_batch, live)
+
+            pending = deque()
+            # Threads for the most requests the limiter can allow, it decides how many of them send at once
+            with ThreadPoolExecutor(max_workers=limiter.max_limit) as executor:
+                for batch in batches:
+                    pending.append(executor.submit(send_batch, upsert_endpoint, batch, live))
+                    # Only a few batches are read ahead of the requests
+                    if len(pending) >= limiter.concurrency * 2:
+                        pending.popleft().result()
+                while pending:
+                    pending.popleft().result()
+
+            elapsed = max(time.monotonic() - start_time, 1e-6)
+            typer.secho(
+                f"Remote indexing: {stats['files']} files in {stats['batches']} batches "
+                f"({stats['bytes'] / 1024**2:.1f} MB) in {elapsed:.1f}s, {stats['files'] / elapsed:.1f} files/sec, "
+                f"{stats['bytes'] / 1024**2 / elapsed:.2f} MB/sec",
+                fg=typer.colors.BRIGHT_BLACK,
+            )
+            sent = {key: value - start_bytes[key] for key, value in http_client.compression_stats().items()}
+            typer.secho(
+                f"Request bodies: {sent['raw_bytes'] / 1024**2:.1f} MB of JSON sent as {sent['wire_bytes'] / 1024**2:.1f} MB "
+                f"({sent['raw_bytes'] / max(sent['wire_bytes'], 1):.1f}x), {sent['compress_time']:.2f}s compressing",
+                fg=typer.colors.BRIGHT_BLACK,
+            )
+            typer.secho(limiter.report(), fg=typer.colors.BRIGHT_BLACK)
 
     typer.secho(f"Created Source: {collection_name}", fg=typer.colors.GREEN, bold=True)
-    set_sources()
+    # The saved source list comes from the service, a collection created anywhere else isn't in it
+    if create_endpoint == VECTORDB_CREATE_ENDPOINT:
+        set_sources()
     return True
 
 
-def create_local_qdrant_db(collection_name="test", link=None, path=None):
-    data, metadata = [], []
+def _local_file_documents(path, files, entries, present, filepaths=None):
+    """
+    Yield (data, metadata) for the new or changed files under path, or among filepaths if given.
+
+    Files whose size and mtime match their entry in `files` are skipped without being read. Manifest
+    entries for every file read are recorded in `entries`, and every file still present in `present`.
+    """
+
+    def unchanged(filepath, stat):
+        entry = files.get(filepath)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            present.add(filepath)
+            return True
+        return False
+
+    def unread(filepath, stat):
+        # Past the crawl's size cap, the file is still there and keeps whatever was indexed for it
+        present.add(filepath)
+
+    for filepath, stat, file_content in iter_files(path, skip=unchanged, filepaths=filepaths, unread=unread):
+        present.add(filepath)
+        document = filepath + ": " + file_content
+        entries[filepath] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": hash_document(document)}
+        entry = files.get(filepath)
+        if entry and entry["hash"] == entries[filepath]["hash"]:
+            # Only the mtime changed, keep the existing points
+            entries[filepath]["ids"] = entry["ids"]
+            continue
+        yield document, {"source": filepath}
+
+
+def chunk_point_id(chunk, source):
+    """Point id for a chunk, the same for every copy of its text regardless of which file it is in."""
+    if chunk.startswith(source + ": "):
+        chunk = chunk[len(source) + 2 :]
+    return uuid.UUID(bytes=hashlib.blake2b(chunk.encode("utf-8", "surrogatepass"), digest_size=16).digest()).hex
+
+
+def _index_local_documents(qdrant_client, collection_name, documents, live, workers=None, existing=(), checkpoint=None):
+    """
+    Chunk, embed and upload (data, metadata) documents into an existing local collection.
+
+    Each step runs as a stage of a Pipeline, so reading, embedding and writing overlap and only the
+    documents and chunks in flight are held in memory. Chunks are identified by their content, so each
+    unique chunk is embedded and stored once, and chunks whose point is in `existing` aren't stored again.
+    Returns the point ids per source and the set of ids that were uploaded.
+
+    checkpoint(completed, uploaded) is called at most every CHECKPOINT_INTERVAL seconds with the ids of the
+    sources whose points have all been written since the last call, and every id uploaded so far.
+    """
+    config = load_config()
+    batch_size = config.get("embedding_batch_size", 64)
+    upsert_batch_size = config.get("upsert_batch_size", 256)
+    queue_size = config.get("pipeline_queue_size", 1024)
+    if workers is None:
+        workers = config.get("embedding_workers", 1)
+    embed_step = batch_size * max(workers, 1)
+
+    chunk_lengths, source_ids, seen = [], {}, set(existing)
+    # Sources whose chunks have all been passed on, and those already given to checkpoint
+    chunked, checkpointed = [], set()
+    existing = set(existing)
+
+    def chunk_stage(documents):
+        for data, metadata in documents:
+            chunk_data, chunk_meta = _chunk_data(data, metadata)
+            chunk_lengths.extend(meta["tokens"] for meta in chunk_meta)
+            ids = source_ids.setdefault(metadata["source"], {})
+            for chunk, meta in zip(chunk_data, chunk_meta):
+                point_id = chunk_point_id(chunk, metadata["source"])
+                ids[point_id] = None
+                if point_id in seen:
+                    # A copy of a chunk that is already indexed, it becomes another source of that point
+                    continue
+                seen.add(point_id)
+                meta["sources"] = [metadata["source"]]
+                yield point_id, chunk, meta
+            chunked.append(metadata["source"])
+
+    def embed_window(window):
+        vectors = embed_chunks([chunk for _, chunk, _ in window], batch_size=batch_size, workers=workers)
+        for vector, (point_id, _, meta) in zip(vectors, window):
+            yield point_id, vector, meta
+
+    def embed_stage(chunks):
+        # Chunks are only length-sorted within a window of the stream, the whole corpus is never held at once
+        window = []
+        for chunk in chunks:
+            window.append(chunk)
+            if len(window) >= embed_step * 4:
+                yield from embed_window(window)
+                window = []
+        if window:
+            yield from embed_window(window)
+
+    pipeline = (
+        Pipeline(documents, name="crawl")
+        .add_stage("chunk", chunk_stage, queue_size=64)
+        .add_stage("embed", embed_stage, queue_size=queue_size)
+    )
+
+    new_ids, ids, vectors, payloads = set(), [], [], []
+    last_checkpoint = time.monotonic()
+
+    def save_checkpoint():
+        nonlocal last_checkpoint
+        if checkpoint is None or time.monotonic() - last_checkpoint < CHECKPOINT_INTERVAL:
+            return
+        # A source is only done once every point it references is written, including ones another source added
+        completed = {}
+        for source in chunked[:]:
+            if source not in checkpointed and all(i in new_ids or i in existing for i in source_ids[source]):
+                completed[source] = list(source_ids[source])
+                checkpointed.add(source)
+        checkpoint(completed, new_ids)
+        last_checkpoint = time.monotonic()
+
+    def flush():
+        upload_points(qdrant_client, collection_name, vectors, payloads, ids=ids)
+        new_ids.update(ids)
+        ids.clear()
+        vectors.clear()
+        payloads.clear()
+        live.update(
+            Panel(
+                f"Indexing: {len(new_ids)} chunks from {len(source_ids)} files",
+                title="[bold green]Indexer[/bold green]",
+                border_style="green",
+            )
+        )
+        save_checkpoint()
+
+    # The local client can only be used from the thread that opened it, so points are written by the caller
+    for point_id, vector, meta in pipeline.run(queue_size=queue_size, sink_name="upsert"):
+        ids.append(point_id)
+        vectors.append(vector)
+        payloads.append(meta)
+        if len(vectors) >= upsert_batch_size:
+            flush()
+    if vectors:
+        flush()
+
+    if chunk_lengths:
+        for line in pipeline.report():
+            typer.secho(line, fg=typer.colors.BRIGHT_BLACK)
+        typer.secho(describe_chunk_lengths(chunk_lengths, get_chunker().chunk_size), fg=typer.colors.BRIGHT_BLACK)
+        duplicates = len(chunk_lengths) - len(new_ids)
+        typer.secho(
+            f"Deduplication: {len(chunk_lengths)} chunks, {len(new_ids)} embedded, "
+            f"{duplicates} already indexed or repeated ({duplicates / len(chunk_lengths):.0%})",
+            fg=typer.colors.BRIGHT_BLACK,
+        )
+        typer.secho(get_embedding_cache("BAAI/bge-base-en-v1.5").report(), fg=typer.colors.BRIGHT_BLACK)
+    return {source: list(ids) for source, ids in source_ids.items()}, new_ids
+
+
+def _update_point_sources(qdrant_client, collection_name, files, touched_ids, new_ids):
+    """
+    Bring the sources of the touched points in line with the files that reference them.
+
+    Points no file references anymore are deleted. new_ids were just uploaded with their first source,
+    so they only need updating when another file shares them. A point whose `source` is no longer one of
+    its sources is moved to one that is, along with the path prefix of its text, so search results never
+    cite a removed file. Returns the number of deleted points.
+    """
+    touched_ids = set(touched_ids)
+    sources = {}
+    for source, entry in files.items():
+        for point_id in entry["ids"]:
+            if point_id in touched_ids:
+                sources.setdefault(point_id, []).append(source)
+
+    orphaned = [point_id for point_id in touched_ids if point_id not in sources]
+    if orphaned:
+        qdrant_client.delete(collection_name=collection_name, points_selector=PointIdsList(points=orphaned))
+
+    # Points uploaded in this run already carry one of their current sources
+    kept = [point_id for point_id in sources if point_id not in new_ids]
+    for start in range(0, len(kept), 256):
+        for point in qdrant_client.retrieve(collection_name, ids=kept[start : start + 256], with_payload=True):
+            point_sources = sources[point.id]
+            payload = {"sources": point_sources}
+            old_source = point.payload.get("source")
+            if old_source not in point_sources:
+                payload["source"] = point_sources[0]
+                data = point.payload.get("data", "")
+                if data.startswith(f"{old_source}: "):
+                    payload["data"] = f"{point_sources[0]}: {data[len(old_source) + 2 :]}"
+            qdrant_client.set_payload(collection_name=collection_name, payload=payload, points=[point.id])
+    for point_id, point_sources in sources.items():
+        if point_id in new_ids and len(point_sources) > 1:
+            qdrant_client.set_payload(
+                collection_name=collection_name, payload={"sources": point_sources}, points=[point_id]
+            )
+    return len(orphaned)
+
+
+def _web_documents(link, files, entries, present, revalidate=False, checkpoint=None):
+    """
+    Yield (data, metadata) for the new or changed pages under link, like _local_file_documents.
+
+    Pages are compared by the hash of their text as extracted, before boilerplate and near-duplicate filtering,
+    since what the filter keeps of a page depends on the order pages arrive in. Pages whose text is unchanged keep
+    their points whatever the filter makes of them this time.
+    """
+
+    def on_page(source, data):
+        entries[source] = {"hash": hash_document(data)}
+        entry = files.get(source)
+        if entry and entry["hash"] == entries[source]["hash"]:
+            entries[source]["ids"] = entry["ids"]
+            present.add(source)
+
+    # A page that couldn't be fetched this time is still there, it keeps what was indexed for it
+    documents = iter_website(link, revalidate=revalidate, checkpoint=checkpoint, on_page=on_page, on_failed=present.add)
+    for data, metadata in documents:
+        source = metadata["source"]
+        if source in present:
+            continue
+        present.add(source)
+        yield data, metadata
+
+
+def _manifest_checkpoint(collection_name, root, files, entries, pending_ids):
+    """
+    Return a checkpoint function for _index_local_documents that saves the manifest as it would be if indexing
+    stopped now. An interrupted run then resumes like a sync, skipping everything already indexed.
+
+    pending_ids are points that may no longer be referenced once indexing finishes, and are checked then.
+    """
+    completed_ids = {}
+
+    def checkpoint(completed, uploaded):
+        completed_ids.update(completed)
+        current, replaced_ids = dict(files), set()
+        for source, entry in list(entries.items()):
+            if "ids" not in entry and source not in completed_ids:
+                continue
+            entry = dict(entry, ids=completed_ids.get(source, entry.get("ids")))
+            if source in current and current[source]["ids"] != entry["ids"]:
+                replaced_ids.update(current[source]["ids"])
+            current[source] = entry
+        pending = sorted(set(pending_ids) | set(uploaded) | replaced_ids)
+        save_manifest(collection_name, dict(root, files=current, pending_ids=pending))
+
+    return checkpoint
+
+
+def create_local_qdrant_db(collection_name="test", link=None, path=None, workers=None):
+    documents, entries, root = [], {}, None
     if link:
-        data, metadata = crawl_website(link)
+        documents = _web_documents(link, {}, entries, set(), checkpoint=links_checkpoint_path(collection_name))
+        root = {"url": link}
     elif path:
-        data, metadata = crawl_files(path)
+        documents = _local_file_documents(path, {}, entries, set())
+        root = {"path": os.path.abspath(path)}
 
     qdrant_client = get_local_qdrant_db()
 
-    final_data, final_metadata = [], []
-
     console = Console()
     with Live(
         Panel(
@@ -139,42 +508,22 @@ def create_local_qdrant_db(collection_name="test", link=None, path=None):
         auto_refresh=True,
         vertical_overflow="visible",
     ) as live:
-        # For each data chunk it based on number of tokens
-        live.update(
-            Panel(
-                "Creating Embeddings...",
-                title="[bold green]Indexer[/bold green]",
-                border_style="green",
-            )
-        )
-
-        final_data, final_metadata, vectors = [], [], []
-        for dat, meta in zip(data, metadata):
-            chunk_data, chunk_meta, chunk_vec = _chunk_data(dat, meta)
-            final_data.extend(chunk_data)
-            final_metadata.extend(chunk_meta)
-            vectors.extend(chunk_vec)
-
         qdrant_client.recreate_collection(
             collection_name=collection_name,
             vectors_config=VectorParams(size=768, distance=Distance.COSINE),
         )
+        checkpoint = _manifest_checkpoint(collection_name, root, {}, entries, []) if root else None
+        source_ids, new_ids = _index_local_documents(
+            qdrant_client, collection_name, documents, live, workers=workers, checkpoint=checkpoint
+        )
 
-        for vector, f_metadata in zip(vectors, final_metadata):
-            filepath = f_metadata["source"]
-
-            live.update(
-                Panel(
-                    f"Indexing: {filepath}",
-                    title="[bold green]Indexer[/bold green]",
-                    border_style="green",
-                )
-            )
-
-            qdrant_client.upsert(
-                collection_name=collection_name,
-                points=[PointStruct(vector=vector, payload=f_metadata, id=uuid.uuid4().hex)],
-            )
+        for source, entry in entries.items():
+            entry["ids"] = source_ids.get(source, [])
+        if root:
+            save_manifest(collection_name, dict(root, files=entries))
+        else:
+            delete_manifest(collection_name)
+        _update_point_sources(qdrant_client, collection_name, entries, new_ids, new_ids)
 
     typer.secho(f"Created Source: {collection_name}", fg=typer.colors.GREEN, bold=True)
 
@@ -182,11 +531,107 @@ def create_local_qdrant_db(collection_name="test", link=None, path=None):
     return qdrant_client
 
 
+def sync_local_qdrant_db(collection_name, path=None, workers=None, filepaths=None, link=None, revalidate=True):
+    """
+    Re-index only the files under a local source that were added, changed or removed since it was indexed.
+
+    Pass filepaths to only check those paths. A path that no longer exists also covers every file indexed below it,
+    so removed directories are dropped too. Web sources are re-crawled and only pages whose content changed are
+    re-indexed. Unless revalidate is False, every cached page is checked against its origin.
+
+    A manifest left by an interrupted create or sync is a checkpoint, so this also resumes those.
+    """
+    manifest = load_manifest(collection_name)
+    if manifest is None or not exists_qdrant_db(collection_name):
+        manifest = manifest or {}
+        if link or (not path and manifest.get("url")):
+            return create_local_qdrant_db(collection_name, link=link or manifest["url"], workers=workers)
+        return create_local_qdrant_db(collection_name, path=path or manifest.get("path"), workers=workers)
+
+    if not path:
+        link = link or manifest.get("url")
+    path = None if link else path or manifest["path"]
+    root = {"url": link} if link else {"path": os.path.abspath(path)}
+    files = manifest["files"]
+    pending_ids = manifest.get("pending_ids", [])
+    entries, present = {}, set()
+
+    candidates = files
+    if filepaths is not None:
+        filepaths = {os.path.abspath(filepath) for filepath in filepaths}
+        dirs = tuple(filepath + os.sep for filepath in filepaths if not os.path.exists(filepath))
+        candidates = [source for source in files if source in filepaths or source.startswith(dirs)]
+        filepaths = sorted(filepath for filepath in filepaths if os.path.isfile(filepath))
+
+    qdrant_client = get_local_qdrant_db()
+
+    console = Console()
+    with Live(
+        Panel(
+            "Syncing files...",
+            title="[bold green]Indexer[/bold green]",
+            border_style="green",
+        ),
+        console=console,
+        transient=True,
+        auto_refresh=True,
+        vertical_overflow="visible",
+    ) as live:
+        if link:
+            checkpoint_path = links_checkpoint_path(collection_name)
+            documents = _web_documents(link, files, entries, present, revalidate=revalidate, checkpoint=checkpoint_path)
+        else:
+            documents = _local_file_documents(path, files, entries, present, filepaths)
+        existing = {point_id for entry in files.values() for point_id in entry["ids"]} | set(pending_ids)
+        source_ids, new_ids = _index_local_documents(
+            qdrant_client,
+            collection_name,
+            documents,
+            live,
+            workers=workers,
+            existing=existing,
+            checkpoint=_manifest_checkpoint(collection_name, root, files, entries, pending_ids),
+        )
+
+        # Replace the points of files that changed and drop the points of files that were removed,
+        # unless another file still shares them
+        touched_ids, changed, removed = set(pending_ids), 0, 0
+        if link and not present:
+            # Nothing was crawled, more likely a failed crawl than a site without pages
+            typer.secho(f"No pages found under {link}, keeping the indexed pages", fg=typer.colors.BRIGHT_RED)
+            candidates = []
+        for source in list(candidates):
+            if source not in present:
+                touched_ids.update(files.pop(source)["ids"])
+                removed += 1
+            elif source in entries and "ids" not in entries[source]:
+                touched_ids.update(files.pop(source)["ids"])
+
+        for source, entry in entries.items():
+            if "ids" not in entry:
+                entry["ids"] = source_ids.get(source, [])
+                touched_ids.update(entry["ids"])
+                # Web pages the filter dropped are recorded too, so they aren't counted as changed again next time
+                changed += source in present
+            files[source] = entry
+
+        # Saved before points are deleted, so an interruption can only leave unused points behind, never missing ones
+        save_manifest(collection_name, dict(root, files=files))
+        _update_point_sources(qdrant_client, collection_name, files, touched_ids, new_ids)
+
+    typer.secho(
+        f"Synced Source: {collection_name} ({changed} new or changed {'pages' if link else 'files'}, {removed} removed)",
+        fg=typer.colors.GREEN,
+        bold=True,
+    )
+    return qdrant_client
+
+
 def list_remote_qdrant_db():
     json_data = {
         "user_id": keyring.get_password(SERVICE_ID, "user_id"),
     }
-    response = requests.post(VECTORDB_LIST_ENDPOINT, json=json_data, headers=get_headers())
+    response = http_client.post(VECTORDB_LIST_ENDPOINT, json=json_data, headers=get_headers())
     response.raise_for_status()  # Raise an exception if the request failed
     return response.json()
 
@@ -210,8 +655,11 @@ def remote_qdrant_search(source_name, user_input, data=None, metadata=None):
         "data": data,
         "metadata": metadata,
     }
-    response = requests.post(VECTORDB_SEARCH_ENDPOINT, json=json_data, headers=get_headers())
-    response.raise_for_status()  # Raise an exception if the request failed
+    # Searches fanned out over many sources share a limiter, kept apart from remote indexing whose requests are far slower
+    limiter = get_remote_limiter("search")
+    with limiter.slot() as slot:
+        response = http_client.post(VECTORDB_SEARCH_ENDPOINT, json=json_data, headers=get_headers())
+        slot.check(response).raise_for_status()  # Raise an exception if the request failed
     set_sources()
     return response.json()
 
@@ -224,7 +672,7 @@ def local_qdrant_search(source_name, user_input):
     hits = qdrant_client.search(
         limit=5,
         collection_name=source_name,
-        query_vector=query_vector[0],
+        query_vector=query_vector,
     )
     hits = [{"score": hit.score, "payload": hit.payload} for hit in hits]
     return hits
@@ -240,12 +688,17 @@ def transient_qdrant_search(user_input, data, metadata):
         collection_name=collection_name, vectors_config=VectorParams(size=768, distance=Distance.COSINE)
     )
 
-    final_data, final_metadata, vectors = [], [], []
+    final_data, final_metadata, seen = [], [], set()
     for dat, meta in zip(data, metadata):
-        chunk_data, chunk_meta, chunk_vec = _chunk_data(dat, meta)
-        final_data.extend(chunk_data)
-        final_metadata.extend(chunk_meta)
-        vectors.extend(chunk_vec)
+        chunk_data, chunk_meta = _chunk_data(dat, meta)
+        for chunk, chunk_metadata in zip(chunk_data, chunk_meta):
+            # Pages of the same site repeat navigation and footers, only keep the first copy
+            point_id = chunk_point_id(chunk, meta["source"])
+            if point_id not in seen:
+                seen.add(point_id)
+                final_data.append(chunk)
+                final_metadata.append(chunk_metadata)
+    vectors = embed_chunks(final_data, batch_size=load_config().get("embedding_batch_size", 64))
 
     qdrant_client.upsert(
         collection_name=collection_name,
@@ -271,7 +724,7 @@ def delete_remote_qdrant_db(collection_name="test"):
         "user_id": keyring.get_password(SERVICE_ID, "user_id"),
         "collection_name": collection_name,
     }
-    response = requests.post(VECTORDB_DELETE_ENDPOINT, json=json_data, headers=get_headers())
+    response = http_client.post(VECTORDB_DELETE_ENDPOINT, json=json_data, headers=get_headers())
     response.raise_for_status()  # Raise an exception if the request failed
     set_sources()
     return response.json()
@@ -280,4 +733,54 @@ def delete_remote_qdrant_db(collection_name="test"):
 def delete_local_qdrant_db(collection_name="test"):
     qdrant_client = get_local_qdrant_db()
     qdrant_client.delete_collection(collection_name=collection_name)
+    delete_manifest(collection_name)
     set_sources()
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    # e.g. python -m mirageml.commands.utils.vectordb [files], indexes generated files into a local stand-in server
+    # and checks the collection is created before anything is upserted into it
+    requests_log = []
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            requests_log.append(("start", self.path, time.monotonic()))
+            # A fixed cost per request plus a little per document, creating takes longer
+            time.sleep(0.03 + 0.001 * len(body["data"]) + (0.3 if self.path == "/create" else 0))
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            requests_log.append(("end", self.path, time.monotonic()))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    source_dir = tempfile.mkdtemp()
+    for i in range(int(sys.argv[1]) if len(sys.argv) > 1 else 1000):
+        with open(os.path.join(source_dir, f"file{i}.txt"), "w") as f:
+            f.write(f"file {i} " * 200)
+
+    create_remote_qdrant_db(
+        "benchmark",
+        path=source_dir,
+        create_endpoint=f"http://127.0.0.1:{server.server_port}/create",
+        upsert_endpoint=f"http://127.0.0.1:{server.server_port}/upsert",
+        # The stand-in needs no login
+        user_id="benchmark",
+        headers={},
+    )
+    created = next(t for event, path, t in requests_log if event == "end" and path == "/create")
+    upserts = [t for event, path, t in requests_log if event == "start" and path == "/upsert"]
+    print(
+        f"{len(upserts) + 1} requests, collection created before the first upsert: {created <= min(upserts, default=created)}"
+    )
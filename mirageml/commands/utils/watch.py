@@ -0,0 +1,195 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from .ignore import IGNORE_FILES, IgnoreMatcher
+from .local_source import walk_files
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MODIFY
+
+EVENT_HEADER = struct.Struct("iIII")
+
+# Returned by a watcher when it lost track of events and the whole tree has to be rescanned
+RESCAN = None
+
+
+class InotifyWatcher:
+    """Reports changed paths under root using Linux inotify, with a watch on every directory that isn't ignored."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.matcher = IgnoreMatcher(self.root)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watches = {}
+        try:
+            self._add_tree(self.root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, root):
+        """Watch root and every directory below it, returning the files already inside."""
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                # Out of inotify watches, let the caller fall back to polling
+                raise OSError(errno, os.strerror(errno))
+            self._watches[wd] = dirpath
+            dirnames[:] = [
+                dirname
+                for dirname in dirnames
+                if not dirname.startswith(".")
+                and not self.matcher.is_ignored(os.path.join(dirpath, dirname), is_dir=True)
+            ]
+            files.extend(os.path.join(dirpath, filename) for filename in filenames)
+        return files
+
+    def _is_watched_dir(self, path):
+        # The same directories _add_tree would have entered had they been there from the start
+        relpath = os.path.relpath(path, self.root)
+        if any(part.startswith(".") for part in relpath.split(os.sep)):
+            return False
+        return os.path.isdir(path) and not self.matcher.is_path_ignored(path)
+
+    def changes(self, timeout):
+        """Wait up to timeout seconds and return the set of changed paths, or RESCAN."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                name = buffer[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    return RESCAN
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                dirpath = self._watches.get(wd)
+                if dirpath is None or not name:
+                    continue
+
+                path = os.path.join(dirpath, os.fsdecode(name))
+                changed.add(path)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and self._is_watched_dir(path):
+                    # Files can land in a new directory before its watch exists
+                    changed.update(self._add_tree(path))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Reports changed paths under root by comparing the size and mtime of every file between scans."""
+
+    def __init__(self, root, interval=2.0):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for filepath in walk_files(self.root):
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            snapshot[filepath] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout):
+        time.sleep(max(timeout, self.interval))
+        snapshot = self._scan()
+        changed = {
+            path for path in snapshot.keys() | self._snapshot.keys() if snapshot.get(path) != self._snapshot.get(path)
+        }
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(root, poll_interval=2.0):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root, interval=poll_interval)
+
+
+def watch_files(root, on_change, debounce=1.0, poll_interval=2.0):
+    """
+    Call on_change(paths) with the files under root that changed, once events have been quiet for debounce seconds.
+
+    Hidden and ignored paths are filtered out. on_change(RESCAN) is called when the ignore rules change or
+    events were dropped, meaning every file has to be checked. Runs until interrupted.
+    """
+    watcher = create_watcher(root, poll_interval=poll_interval)
+    matcher = IgnoreMatcher(root)
+    pending, last_event = set(), 0.0
+    try:
+        while True:
+            try:
+                changed = watcher.changes(timeout=debounce)
+            except OSError:
+                # Out of inotify watches for a new directory, poll from now on so its files aren't missed
+                watcher.close()
+                watcher = PollingWatcher(root, interval=poll_interval)
+                changed = RESCAN
+            if changed is RESCAN or any(os.path.basename(path) in IGNORE_FILES for path in changed):
+                if isinstance(watcher, InotifyWatcher):
+                    # Watch the tree again, so directories that are no longer ignored get watched too
+                    watcher.close()
+                    watcher = create_watcher(root, poll_interval=poll_interval)
+                matcher = IgnoreMatcher(root)
+                on_change(RESCAN)
+                pending = set()
+                continue
+
+            for path in changed:
+                relpath = os.path.relpath(path, matcher.root)
+                if any(part.startswith(".") for part in relpath.split(os.sep)):
+                    continue
+                if not matcher.is_path_ignored(path):
+                    pending.add(path)
+                    last_event = time.monotonic()
+
+            if pending and time.monotonic() - last_event >= debounce:
+                on_change(pending)
+                pending = set()
+    finally:
+        watcher.close()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from . import http_client
+
+PACKAGE_DIR = os.path.dirname(__file__)
+WEB_CACHE_DIR = os.path.join(PACKAGE_DIR, "web_cache")
+WEB_CACHE_TTL = 24 * 3600
+WEB_CACHE_MAX_BYTES = 256 * 1024**2
+# Evicting stops once the pages left fit in this fraction of max_bytes, so the next few writes don't rescan the directory
+EVICTION_TARGET = 0.75
+REVALIDATE_WORKERS = 8
+REVALIDATE_TIMEOUT = 10
+
+
+class WebCache:
+    """
+    Extracted page content per URL, one JSON file per URL.
+
+    An entry is served as is for ttl seconds after it was last checked. After that the origin is asked
+    with If-None-Match/If-Modified-Since when the entry has either, and a 304 keeps the entry for another
+    ttl without extracting the page again. Least recently used entries are dropped once the cache is over
+    max_bytes.
+    """
+
+    def __init__(self, cache_dir=WEB_CACHE_DIR, ttl=WEB_CACHE_TTL, max_bytes=WEB_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.fresh, self.revalidated, self.misses = 0, 0, 0
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest() + ".json")
+
+    def _read(self, url):
+        try:
+            with open(self._path(url)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def _write(self, url, entry):
+        path = self._path(url)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            if self._size is not None:
+                self._size += os.path.getsize(path) - old_size
+            if self._total_size() > self.max_bytes:
+                self._evict()
+
+    def _total_size(self):
+        if self._size is None:
+            self._size = sum(e.stat().st_size for e in os.scandir(self.cache_dir) if e.name.endswith(".json"))
+        return self._size
+
+    def _evict(self):
+        # Entries are touched when they are served, so the oldest mtimes are the least recently used
+        entries = sorted(
+            (e.stat().st_mtime, e.stat().st_size, e.path)
+            for e in os.scandir(self.cache_dir)
+            if e.name.endswith(".json")
+        )
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes * EVICTION_TARGET:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+    @staticmethod
+    def _validators(response):
+        return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+    def check(self, url, max_age=None):
+        """
+        Return (page, validators). page is the cached extraction if it is still valid, otherwise None and
+        validators holds the origin's current ETag/Last-Modified to store with the new extraction, if the
+        origin was asked at all. Pages that aren't cached, or were cached without validators, are a miss
+        without a request.
+
+        Entries checked less than max_age seconds ago (the ttl by default) are served without asking the origin.
+        """
+        entry = self._read(url)
+        now = time.time()
+        if entry and now - entry["checked_at"] < (self.ttl if max_age is None else max_age):
+            try:
+                os.utime(self._path(url))
+            except OSError:
+                pass
+            self.fresh += 1
+            return entry["page"], None
+
+        # Without a stored validator there is nothing to ask the origin, so the page is extracted again
+        if not entry or not (entry.get("etag") or entry.get("last_modified")):
+            self.misses += 1
+            return None, {}
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            # Only the status and headers are needed, the body is never read
+            response = http_client.get(url, headers=headers, stream=True, timeout=REVALIDATE_TIMEOUT)
+            response.close()
+        except requests.RequestException:
+            # The origin can't be reached, so a stale entry is better than nothing
+            self.fresh += 1
+            return entry["page"], None
+
+        validators = self._validators(response)
+        # Some servers answer a conditional request with the full page, but an unchanged ETag says enough
+        if response.status_code == 304 or (validators["etag"] and validators["etag"] == entry.get("etag")):
+            entry["checked_at"] = now
+            self._write(url, entry)
+            self.revalidated += 1
+            return entry["page"], None
+        self.misses += 1
+        return None, validators
+
+    def check_many(self, urls, max_age=None):
+        """Check urls concurrently, returning {url: (page, validators)}."""
+        with ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS) as executor:
+            return dict(zip(urls, executor.map(lambda url: self.check(url, max_age), urls)))
+
+    def put(self, url, page, validators=None):
+        validators = validators or {}
+        entry = {
+            "url": url,
+            "page": page,
+            "etag": validators.get("etag"),
+            "last_modified": validators.get("last_modified"),
+            "checked_at": time.time(),
+        }
+        self._write(url, entry)
+
+    def report(self):
+        return f"Web cache: {self.fresh} pages fresh, {self.revalidated} revalidated, {self.misses} extracted"
+
+
+_web_cache = None
+_web_cache_lock = threading.Lock()
+
+
+def get_web_cache():
+    global _web_cache
+    with _web_cache_lock:
+        if _web_cache is None:
+            from ..config import load_config
+
+            config = load_config()
+            _web_cache = WebCache(
+                ttl=config.get("web_cache_ttl", WEB_CACHE_TTL),
+                max_bytes=config.get("web_cache_max_bytes", WEB_CACHE_MAX_BYTES),
+            )
+        return _web_cache
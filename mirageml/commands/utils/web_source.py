@@ -1,16 +1,37 @@
 import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
 import typer
 from rich.console import Console
 from rich.live import Live
 from rich.panel import Panel
 
 from ...constants import WEB_SCRAPE_EXTRACT_ENDPOINT, WEB_SCRAPE_LINKS_ENDPOINT, get_headers
+from ..config import load_config
+from . import http_client
 from .custom_inputs import input_or_timeout
+from .html_extract import get_local_extractor
+from .page_filter import PageFilter
+from .web_cache import get_web_cache
 
 console = Console()
 
+# URLs sent to the extract endpoint per request, and requests in flight at once
+EXTRACT_BATCH_SIZE = 16
+EXTRACT_WORKERS = 4
+# Extracted pages waiting to be indexed
+PAGE_QUEUE_SIZE = 64
+
+_DONE = object()
+
+
+def get_extractor():
+    """The configured extraction engine, "remote" for the extract endpoint or "local" to fetch and convert pages here."""
+    return load_config().get("web_extractor", "remote")
+
 
 def validate_all_scraped(visited_links, urls):
     # pretty print all of the subpages that were indexed and ask the user if they want to continue
@@ -65,51 +86,183 @@ def validate_all_scraped(visited_links, urls):
     return start_url, to_visit, urls
 
 
-def crawl_website(start_url):
+def iter_website(
+    start_url,
+    live=None,
+    links_endpoint=WEB_SCRAPE_LINKS_ENDPOINT,
+    extract_endpoint=WEB_SCRAPE_EXTRACT_ENDPOINT,
+    batch_size=EXTRACT_BATCH_SIZE,
+    workers=EXTRACT_WORKERS,
+    revalidate=False,
+    checkpoint=None,
+    extractor=None,
+    on_page=None,
+    on_failed=None,
+):
+    """
+    Yield (data, metadata) for the pages under start_url as soon as they are extracted.
+
+    Links are sent for extraction in batches of batch_size while the crawl is still discovering them,
+    with at most `workers` batches in flight. Pages go through a PageFilter on their way out.
+    Cached pages are reused until their TTL runs out, or revalidated with the origin first if revalidate is set.
+
+    With a checkpoint path, discovered links are appended to that file until the crawl finishes, and the links
+    left there by an interrupted crawl are extracted first. Their pages are usually still in the web cache.
+
+    extractor picks where pages are extracted, see get_extractor. on_page is called with (source, data) for every
+    extracted page before it is filtered, including the pages the filter drops. Pages the local extractor can't
+    fetch this time are skipped, and on_failed is called with their url from the thread that tried.
+    """
     if not start_url.endswith("/"):
         start_url += "/"
-    urls = {start_url: set()}
-    visited_links = set()
-    to_visit = [start_url]
+    headers = get_headers()
+    web_cache = get_web_cache()
+    extractor = extractor or get_extractor()
+    pages = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+    slots = threading.BoundedSemaphore(workers)
+    stop = threading.Event()
+    errors, failed = [], []
 
-    while to_visit:
-        with Live(
-            Panel(
-                "Preparing to Scrape...",
-                title="[bold green]Scraper[/bold green]",
-                border_style="green",
-            ),
-            console=console,
-            transient=True,
-            auto_refresh=True,
-            vertical_overflow="visible",
-        ) as live:
-            response = requests.post(
-                WEB_SCRAPE_LINKS_ENDPOINT, json={"urls": [start_url]}, headers=get_headers(), stream=True
-            )
-            if response.status_code == 200:
-                for chunk in response.iter_lines():
-                    # process line here
-                    link = chunk.decode("utf-8")
-                    if live:
-                        live.update(
-                            Panel(
-                                f"Scraping: {link}",
-                                title="[bold green]Scraper[/bold green]",
-                                border_style="green",
-                            )
-                        )
-                    visited_links.add(link.strip())
-
-        # Skip for now, assume that the scraper can find all paths
-        # start_url, to_visit, urls = validate_all_scraped(visited_links, urls)
-        start_url, to_visit, urls = "", [], urls
+    def fetch_failed(url, error):
+        failed.append(url)
+        if on_failed:
+            on_failed(url)
+
+    def update(message, title):
+        if live:
+            live.update(Panel(message, title=f"[bold green]{title}[/bold green]", border_style="green"))
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def extract(urls):
+        try:
+            # Pages that are cached and unchanged at the origin skip extraction
+            validators = {}
+            for url, (page, url_validators) in web_cache.check_many(urls, max_age=0 if revalidate else None).items():
+                if page is None:
+                    validators[url] = url_validators
+                else:
+                    put(page)
+            if not validators:
+                return
 
+            if extractor == "local":
+                for page, page_validators in get_local_extractor().extract(list(validators), on_error=fetch_failed):
+                    if stop.is_set():
+                        break
+                    web_cache.put(page["source"], page, page_validators)
+                    put(page)
+                return
+
+            response = http_client.post(extract_endpoint, json={"urls": list(validators)}, headers=headers, stream=True)
+            # Failing the crawl keeps a sync from treating the pages as removed
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if stop.is_set():
+                    break
+                if line:
+                    page = json.loads(line.decode("utf-8"))
+                    web_cache.put(page["source"], page, validators.get(page["source"]))
+                    put(page)
+        finally:
+            slots.release()
+
+    def crawl():
+        links_file = None
+        try:
+            known_links = []
+            if checkpoint:
+                if os.path.exists(checkpoint):
+                    with open(checkpoint) as f:
+                        known_links = [line.strip() for line in f if line.strip()]
+                os.makedirs(os.path.dirname(checkpoint), exist_ok=True)
+                links_file = open(checkpoint, "a")
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures, batch, seen = [], [], set()
+
+                def submit(urls):
+                    # Blocks while every worker is busy, which also slows down reading links
+                    slots.acquire()
+                    futures.append(executor.submit(extract, urls))
+
+                def add(link, record):
+                    nonlocal batch
+                    if not link or link in seen:
+                        return
+                    seen.add(link)
+                    if record and links_file:
+                        links_file.write(link + "\n")
+                        links_file.flush()
+                    update(f"Scraping: {link}", "Scraper")
+                    batch.append(link)
+                    if len(batch) >= batch_size:
+                        submit(batch)
+                        batch = []
+
+                for link in known_links:
+                    add(link, record=False)
+                response = http_client.post(links_endpoint, json={"urls": [start_url]}, headers=headers, stream=True)
+                if response.status_code == 200:
+                    for line in response.iter_lines():
+                        add(line.decode("utf-8").strip(), record=True)
+                        if stop.is_set():
+                            break
+                if batch and not stop.is_set():
+                    submit(batch)
+                for future in futures:
+                    future.result()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            if links_file:
+                links_file.close()
+            put(_DONE)
+
+    def extracted_pages():
+        while True:
+            json_data = pages.get()
+            if json_data is _DONE:
+                return
+            update(f"Cleaning: {json_data['source']}", "Cleaner")
+            if on_page:
+                on_page(json_data["metadata"]["source"], json_data["data"])
+            yield json_data["data"], json_data["metadata"]
+
+    thread = threading.Thread(target=crawl, name="crawl", daemon=True)
+    thread.start()
+    page_filter = PageFilter()
+    try:
+        yield from page_filter.filter(extracted_pages())
+    finally:
+        # Also reached when the consumer stops early, in-flight requests are abandoned
+        stop.set()
+    if errors:
+        raise errors[0]
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    if failed:
+        typer.secho(
+            f"Skipped {len(failed)} pages that couldn't be fetched, e.g. {failed[0]}", fg=typer.colors.BRIGHT_RED
+        )
+    if page_filter.pages_in:
+        typer.secho(page_filter.report(), fg=typer.colors.BRIGHT_BLACK)
+        typer.secho(web_cache.report(), fg=typer.colors.BRIGHT_BLACK)
+
+
+def crawl_website(start_url, **kwargs):
+    """Crawl and extract every page under start_url, returning (data, metadata) lists."""
     data, metadata = [], []
     with Live(
         Panel(
-            "Preparing to Clean...",
-            title="[bold green]Cleaner[/bold green]",
+            "Preparing to Scrape...",
+            title="[bold green]Scraper[/bold green]",
             border_style="green",
         ),
         console=console,
@@ -117,32 +270,13 @@ def crawl_website(start_url):
         auto_refresh=True,
         vertical_overflow="visible",
     ) as live:
-        response = requests.post(
-            WEB_SCRAPE_EXTRACT_ENDPOINT, json={"urls": list(visited_links)}, headers=get_headers(), stream=True
-        )
-        if response.status_code == 200:
-            for chunk in response.iter_lines():
-                # process line here
-                decoded_chunk = chunk.decode("utf-8")
-                json_data = json.loads(decoded_chunk)
-
-                source = json_data["source"]
-                data.extend([json_data["data"]])
-                metadata.extend([json_data["metadata"]])
-
-                if live:
-                    live.update(
-                        Panel(
-                            f"Cleaning: {source}",
-                            title="[bold green]Cleaner[/bold green]",
-                            border_style="green",
-                        )
-                    )
-
+        for page_data, page_metadata in iter_website(start_url, live=live, **kwargs):
+            data.append(page_data)
+            metadata.append(page_metadata)
     return data, metadata
 
 
-def extract_from_url(url, live=None):
+def extract_from_url(url, live=None, extractor=None):
     if live:
         live.update(
             Panel(
@@ -152,8 +286,21 @@ def extract_from_url(url, live=None):
             )
         )
 
-    response = requests.post(WEB_SCRAPE_EXTRACT_ENDPOINT, json={"urls": [url]}, headers=get_headers())
-    json_data = response.json()
+    web_cache = get_web_cache()
+    json_data, validators = web_cache.check(url)
+    if json_data is None and (extractor or get_extractor()) == "local":
+        json_data, validators = get_local_extractor().fetch(url)
+        if json_data is None:
+            raise ValueError(f"Unable to extract text from {url}")
+        web_cache.put(url, json_data, validators)
+    elif json_data is None:
+        response = http_client.post(WEB_SCRAPE_EXTRACT_ENDPOINT, json={"urls": [url]}, headers=get_headers())
+        response.raise_for_status()
+        json_data = response.json()
+        # Only a page is cached, an error answer would otherwise be served until the TTL runs out
+        if not isinstance(json_data, dict) or not json_data.get("source") or json_data.get("data") is None:
+            raise ValueError(f"Unable to extract text from {url}")
+        web_cache.put(url, json_data, validators)
 
     source, url_data = (
         json_data["source"],
@@ -166,8 +313,11 @@ def extract_from_url(url, live=None):
 
 
 if __name__ == "__main__":
+    import sys
     import time
 
+    # e.g. python -m mirageml.commands.utils.web_source <url> [links endpoint] [extract endpoint] for a local stand-in
+    endpoints = dict(zip(["links_endpoint", "extract_endpoint"], sys.argv[2:4]))
     start_time = time.time()
-    crawl_website("https://modal.com/docs/guide/")
-    print(f"Time taken: {time.time() - start_time}")
+    data, _ = crawl_website(sys.argv[1] if len(sys.argv) > 1 else "https://modal.com/docs/guide/", **endpoints)
+    print(f"{len(data)} pages, Time taken: {time.time() - start_time}")
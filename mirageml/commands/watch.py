@@ -0,0 +1,39 @@
+import os
+
+import typer
+
+from .add_source import fix_name
+from .config import load_config
+from .utils.vectordb import sync_local_qdrant_db
+from .utils.watch import RESCAN, watch_files
+
+
+def watch(path=".", workers=None):
+    config = load_config()
+    if not config["local_mode"]:
+        typer.secho(
+            "Watching files keeps a local index up to date. Set local_mode to True with `mirageml config set`",
+            fg=typer.colors.BRIGHT_RED,
+            bold=True,
+        )
+        return
+    if not os.path.isdir(path):
+        typer.secho(f"Unable to read dir: {path}", fg=typer.colors.BRIGHT_RED, bold=True)
+        return
+
+    collection_name = fix_name(os.path.abspath(path))
+    sync_local_qdrant_db(collection_name=collection_name, path=path, workers=workers)
+
+    def on_change(filepaths):
+        if filepaths is RESCAN:
+            sync_local_qdrant_db(collection_name=collection_name, path=path, workers=workers)
+        else:
+            sync_local_qdrant_db(collection_name=collection_name, path=path, workers=workers, filepaths=filepaths)
+
+    typer.secho(
+        f"Watching {os.path.abspath(path)} for changes. Ctrl+C to stop", fg=typer.colors.BRIGHT_GREEN, bold=True
+    )
+    try:
+        watch_files(path, on_change, debounce=config.get("watch_debounce", 1.0))
+    except KeyboardInterrupt:
+        typer.secho("Stopped watching.", fg=typer.colors.BRIGHT_GREEN, bold=True)
@@ -1,3 +1,6 @@
+import threading
+import time
+
 from supabase import create_client
 
 SERVICE_ID = "mirageml"
@@ -29,41 +32,105 @@ VECTORDB_DELETE_ENDPOINT = "https://mirageml--vectordb-delete-db.modal.run"
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
-def fetch_new_access_token():
+# Tokens are refreshed this many seconds before they expire, so a request never goes out with one about to expire
+TOKEN_REFRESH_MARGIN = 60
+# After a failed early refresh the current token is used for this long before trying again
+TOKEN_REFRESH_RETRY = 10
+
+# Access token, refresh token and expiry, read from the keyring once per process and again before each refresh
+_token = None
+_token_lock = threading.Lock()
+_next_refresh = 0.0
+
+
+def _read_token():
     import keyring
 
-    refresh_token = keyring.get_password(SERVICE_ID, "refresh_token")
-    response = supabase.auth._refresh_access_token(refresh_token)
+    expires_at = keyring.get_password(SERVICE_ID, "expires_at")
+    return {
+        "access_token": keyring.get_password(SERVICE_ID, "access_token"),
+        "refresh_token": keyring.get_password(SERVICE_ID, "refresh_token"),
+        "expires_at": float(expires_at) if expires_at else None,
+    }
+
+
+def _load_token():
+    global _token
+    if _token is None:
+        _token = _read_token()
+    return _token
+
+
+def _refresh_token():
+    """
+    Return a fresh access token, called holding _token_lock.
+
+    Supabase rotates refresh tokens, so the keyring is read again first. If another process refreshed since this
+    one last read it, its newer token is used, rather than sending a refresh token that has already been spent.
+    """
+    import keyring
+
+    global _token
+    stored = _read_token()
+    if _token is None or (stored["expires_at"] or 0) > (_token["expires_at"] or 0):
+        _token = stored
+        if stored["expires_at"] is None or stored["expires_at"] - TOKEN_REFRESH_MARGIN > time.time():
+            return stored["access_token"]
+
+    response = supabase.auth._refresh_access_token(stored["refresh_token"])
     session = response.session
     keyring.set_password(SERVICE_ID, "access_token", session.access_token)
     keyring.set_password(SERVICE_ID, "refresh_token", session.refresh_token)
     keyring.set_password(SERVICE_ID, "expires_at", str(session.expires_at))
+    _token = {
+        "access_token": session.access_token,
+        "refresh_token": session.refresh_token,
+        "expires_at": float(session.expires_at),
+    }
     return session.access_token
 
 
-def get_headers():
-    import time
+def fetch_new_access_token():
+    with _token_lock:
+        return _refresh_token()
 
-    import keyring
+
+def get_access_token():
+    """
+    The access token, from a cache shared by every thread in the process.
+
+    The keyring is only read the first time and before a refresh. A token about to expire is refreshed once, under
+    a lock, while other callers wait for that refresh instead of starting their own.
+    """
     import typer
 
-    expires_at = keyring.get_password(SERVICE_ID, "expires_at")
-    access_token = keyring.get_password(SERVICE_ID, "access_token")
-    if expires_at and float(expires_at) < time.time():
+    global _next_refresh
+    token = _token
+    if token is not None and (token["expires_at"] is None or token["expires_at"] - TOKEN_REFRESH_MARGIN > time.time()):
+        return token["access_token"]
+
+    with _token_lock:
+        token = _load_token()
+        now = time.time()
+        # Another caller may have refreshed it while this one waited for the lock
+        if token["expires_at"] is None or token["expires_at"] - TOKEN_REFRESH_MARGIN > now:
+            return token["access_token"]
+        if token["expires_at"] > now and now < _next_refresh:
+            return token["access_token"]
         try:
-            refresh_token = keyring.get_password(SERVICE_ID, "refresh_token")
-            response = supabase.auth._refresh_access_token(refresh_token)
-            session = response.session
-            keyring.set_password(SERVICE_ID, "access_token", session.access_token)
-            keyring.set_password(SERVICE_ID, "refresh_token", session.refresh_token)
-            keyring.set_password(SERVICE_ID, "expires_at", str(session.expires_at))
-            access_token = session.access_token
+            return _refresh_token()
         except Exception as e:
+            if token["expires_at"] > now:
+                # Refreshing early failed, the current token still works for a while
+                _next_refresh = now + TOKEN_REFRESH_RETRY
+                return token["access_token"]
             print(e)
             typer.echo("Please login again. Run `mirageml login`")
             raise typer.Exit()
-    headers = {"Authorization": f"Bearer {access_token}"}
-    return headers
+
+
+def get_headers():
+    return {"Authorization": f"Bearer {get_access_token()}"}
 
 
 def help_list_sources(command_prompt):